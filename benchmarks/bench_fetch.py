@@ -0,0 +1,97 @@
+"""Compare the transfer size and wall time of the template fetch strategies.
+
+Builds a large local template repository (many files, long history) and runs `GHT.init` and
+a render fetch with each strategy against its file:// URL.
+
+    $ python benchmarks/bench_fetch.py --files 2000 --commits 50
+"""
+
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import click
+import yaml
+
+from gittr.cli.action import GHT
+
+
+def make_template(path, files, commits, file_size):
+    """
+    Create a template repository with `files` blobs rewritten over `commits` commits
+    """
+    subprocess.run(["git", "init", "-q", path], check=True)
+    subprocess.run(["git", "-C", path, "config", "uploadpack.allowFilter", "true"], check=True)
+    config = yaml.dump(dict(ght=dict(template=dict(url=f"file://{path}"), name="bench")))
+
+    stream = []
+    for c in range(commits):
+        stream.append(f"commit refs/heads/master\ncommitter B <b@example.com> {c} +0000\n")
+        stream.append(f"data {len(str(c))}\n{c}\n")
+        if c == 0:
+            stream.append(f"M 100644 inline .github/ght.yaml\ndata {len(config)}\n{config}\n")
+        for i in range(c % 10, files, 10 if c else 1):
+            data = f"{{{{ ght.name }}}} {c} {i}\n".ljust(file_size, ".")
+            stream.append(f"M 100644 inline d{i % 100}/f{i}.txt\ndata {len(data)}\n{data}\n")
+    subprocess.run(
+        ["git", "-C", path, "fast-import", "--quiet"], input="".join(stream).encode(), check=True
+    )
+
+
+def objects_kib(repo_path):
+    """
+    Size of the object database (loose and packed) in KiB
+    """
+    out = subprocess.run(
+        ["git", "-C", repo_path, "count-objects", "-v"], capture_output=True, check=True
+    ).stdout.decode()
+    counts = dict(line.split(": ") for line in out.splitlines())
+    return int(counts["size"]) + int(counts["size-pack"])
+
+
+@click.command()
+@click.option("--files", default=2000, help="Number of files in the template.")
+@click.option("--commits", default=50, help="Number of commits in the template history.")
+@click.option("--file-size", default=1024, help="Size of each file in bytes.")
+@click.option("--output", type=click.File("w"), default=None, help="Write the results as JSON.")
+def main(files, commits, file_size, output):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        template = os.path.join(tmp_dir, "template")
+        make_template(template, files, commits, file_size)
+
+        for strategy in ("full", "shallow", "config"):
+            path = os.path.join(tmp_dir, strategy)
+            start = time.perf_counter()
+            ght = GHT.init(path=path, template_url=f"file://{template}", fetch_strategy=strategy)
+            init_seconds = time.perf_counter() - start
+            init_kib = objects_kib(path)
+
+            start = time.perf_counter()
+            with ght.fetch_template():
+                pass
+            render_seconds = time.perf_counter() - start
+            results.append(
+                dict(
+                    strategy=strategy,
+                    init_seconds=init_seconds,
+                    init_kib=init_kib,
+                    render_fetch_seconds=render_seconds,
+                    render_fetch_kib=objects_kib(path) - init_kib,
+                )
+            )
+
+    click.echo(f"{'strategy':10} {'init s':>8} {'init KiB':>10} {'fetch s':>8} {'fetch KiB':>10}")
+    for r in results:
+        click.echo(
+            f"{r['strategy']:10} {r['init_seconds']:8.2f} {r['init_kib']:10} "
+            f"{r['render_fetch_seconds']:8.2f} {r['render_fetch_kib']:10}"
+        )
+    if output:
+        json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Time `GHT.init`, the render and each of its phases on a synthetic template.
+
+The template is generated locally and fetched through its file:// URL, so the benchmark needs no
+network. Each phase is timed from its trace span (see gittr.cli.trace), and reported as the
+median of --repeat renders. The peak Python memory of one more render is recorded with
+tracemalloc.
+
+    $ python benchmarks/bench_render.py --files 5000 --output results.json
+    $ python benchmarks/bench_render.py --files 5000 --baseline results.json --threshold 0.1
+
+With --baseline, the command fails when a metric is more than its threshold above the baseline.
+"""
+
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+import click
+import git
+
+from gittr.cli import __version__, trace
+from gittr.cli.action import GHT
+
+from synthetic import make_template
+
+PHASES = (
+    "GHT.render",
+    "GHT.render_tree",
+    "GHT.render_tree_objects",
+    "GHT.prepare_tree_for_rendering",
+    "GHT.render_ght_conf",
+    "GHT.render_tree_content",
+    "GHT.render_tree_structure",
+    "GHT.commit_index",
+    "GHT.commit_objects",
+)
+
+
+def render(path, url, jobs, backend):
+    """
+    Initialize a GHT repository at `path` from `url` and render it, returns the init seconds
+    """
+    start = time.perf_counter()
+    ght = GHT.init(path=path, template_url=url, jobs=jobs)
+    init_seconds = time.perf_counter() - start
+    ght.render(backend=backend)
+    return init_seconds
+
+
+def timed_render(path, url, jobs, backend):
+    """
+    The seconds spent in init, in each phase, and in git subprocesses of one render
+    """
+    trace_path = path + ".trace.json"
+    trace.start(trace_path)
+    try:
+        init_seconds = render(path, url, jobs, backend)
+    finally:
+        trace.stop()
+    with open(trace_path) as f:
+        events = json.load(f)["traceEvents"]
+
+    metrics = defaultdict(float, init_seconds=init_seconds)
+    for e in events:
+        if e["ph"] != "X":
+            continue
+        if e["name"] in PHASES:
+            metrics[f"{e['name']}_seconds"] += e["dur"] / 1e6
+        elif e["cat"] == "git":
+            metrics["git_seconds"] += e["dur"] / 1e6
+            metrics["git_calls"] += 1
+    return metrics
+
+
+def compare(results, baseline, threshold, memory_threshold):
+    """
+    The (metric, baseline, current, change) of the metrics above their threshold
+    """
+    if baseline["params"] != results["params"]:
+        click.echo("warning: the baseline was run with other parameters", err=True)
+
+    regressions = []
+    for name, current in results["metrics"].items():
+        previous = baseline["metrics"].get(name)
+        if not previous or name == "git_calls":
+            continue
+        limit = memory_threshold if name.endswith("_kib") else threshold
+        change = current / previous - 1
+        if change > limit:
+            regressions.append((name, previous, current, change))
+    return regressions
+
+
+@click.command()
+@click.option("--files", default=1000, help="Number of files in the template.")
+@click.option("--depth", default=3, help="Directory depth of the files.")
+@click.option("--file-size", default=1024, help="Size of each file in bytes.")
+@click.option("--jinja-share", default=0.5, help="Share of the files with Jinja expressions.")
+@click.option("--templated-names", default=10, help="Number of files with a templated name.")
+@click.option("--jobs", default=1, help="Render worker processes.")
+@click.option("--backend", type=click.Choice(["checkout", "odb"]), default="checkout")
+@click.option("--repeat", default=3, help="Number of timed renders.")
+@click.option("--output", type=click.File("w"), default=None, help="Write the results as JSON.")
+@click.option(
+    "--baseline", type=click.File("r"), default=None, help="Compare with these JSON results."
+)
+@click.option("--threshold", default=0.2, help="Allowed relative slowdown of each timing.")
+@click.option("--memory-threshold", default=0.1, help="Allowed relative growth of peak memory.")
+def main(
+    files,
+    depth,
+    file_size,
+    jinja_share,
+    templated_names,
+    jobs,
+    backend,
+    repeat,
+    output,
+    baseline,
+    threshold,
+    memory_threshold,
+):
+    params = dict(
+        files=files,
+        depth=depth,
+        file_size=file_size,
+        jinja_share=jinja_share,
+        templated_names=templated_names,
+        jobs=jobs,
+        backend=backend,
+    )
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        url = make_template(
+            os.path.join(tmp_dir, "template"),
+            files=files,
+            depth=depth,
+            file_size=file_size,
+            jinja_share=jinja_share,
+            templated_names=templated_names,
+        )
+        for i in range(repeat):
+            runs.append(timed_render(os.path.join(tmp_dir, f"run{i}"), url, jobs, backend))
+
+        tracemalloc.start()
+        render(os.path.join(tmp_dir, "memory"), url, jobs, backend)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    metrics = {
+        name: statistics.median(run.get(name, 0) for run in runs) for name in sorted(runs[0])
+    }
+    metrics["peak_memory_kib"] = peak // 1024
+    results = dict(
+        params=params,
+        metrics=metrics,
+        environment=dict(
+            gittr=__version__,
+            python=platform.python_version(),
+            git=".".join(map(str, git.Git().version_info)),
+            platform=platform.platform(),
+        ),
+    )
+
+    for name, value in metrics.items():
+        click.echo(f"{name:40} {value:12.4f}")
+    if output:
+        json.dump(results, output, indent=2)
+
+    if baseline:
+        regressions = compare(results, json.load(baseline), threshold, memory_threshold)
+        for name, previous, current, change in regressions:
+            click.echo(f"REGRESSION {name}: {previous:.4f} -> {current:.4f} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        click.echo("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Time the startup of `gittr --help` against a budget.
+
+Each run is a fresh interpreter, `python -m gittr.cli --help`, timed next to a bare interpreter
+start so that the gittr share of the startup stands out. The command fails when the median
+gittr share is over --budget-ms, or when --help imports one of the heavy libraries that only
+the subcommands need.
+
+    $ python benchmarks/bench_startup.py --repeat 20 --budget-ms 100
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+# Modules that `gittr --help` must not import
+HEAVY_MODULES = ("git", "gitdb", "jinja2", "jinja2_time", "yaml", "entrypoints")
+
+HELP = [sys.executable, "-m", "gittr.cli", "--help"]
+BARE = [sys.executable, "-c", "pass"]
+
+
+def wall_ms(argv):
+    start = time.perf_counter()
+    subprocess.run(argv, stdout=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def help_imports():
+    """
+    The top-level modules imported by `gittr --help`
+    """
+    script = (
+        "import sys, runpy\n"
+        "sys.argv = ['gittr', '--help']\n"
+        "try:\n"
+        "    runpy.run_module('gittr.cli', run_name='__main__')\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print('\\n'.join(sorted({m.split('.')[0] for m in sys.modules})), file=sys.stderr)\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", script], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    return set(out.stderr.decode().split())
+
+
+@click.command()
+@click.option("--repeat", default=20, help="Number of timed starts.")
+@click.option("--budget-ms", default=100.0, help="Allowed median startup over the interpreter.")
+@click.option("--output", type=click.File("w"), default=None, help="Write the results as JSON.")
+def main(repeat, budget_ms, output):
+    wall_ms(HELP)  # warm the filesystem cache
+    bare = statistics.median(wall_ms(BARE) for _ in range(repeat))
+    total = statistics.median(wall_ms(HELP) for _ in range(repeat))
+    heavy = sorted(help_imports().intersection(HEAVY_MODULES))
+
+    results = dict(interpreter_ms=bare, help_ms=total, gittr_ms=total - bare, heavy_imports=heavy)
+    click.echo(f"interpreter {bare:8.1f} ms")
+    click.echo(f"gittr --help {total:7.1f} ms ({total - bare:.1f} ms over the interpreter)")
+    if output:
+        json.dump(results, output, indent=2)
+
+    failed = False
+    if heavy:
+        click.echo(f"FAIL: --help imports {', '.join(heavy)}")
+        failed = True
+    if total - bare > budget_ms:
+        click.echo(f"FAIL: over the {budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
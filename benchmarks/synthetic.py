@@ -0,0 +1,75 @@
+"""Synthetic template repositories for the benchmarks.
+
+>>> make_template("/tmp/template", files=1000, depth=3, file_size=2048, jinja_share=0.5)
+"""
+
+import subprocess
+
+import yaml
+
+
+def template_config(path):
+    """
+    The .github/ght.yaml of a synthetic template at `path`
+    """
+    return dict(
+        ght=dict(
+            template=dict(url=f"file://{path}", ref="master"),
+            name="bench",
+            prefix="{{ ght.name }}-generated",
+        )
+    )
+
+
+def template_path(i, depth, fanout=10, templated=False):
+    """
+    The path of the `i`th file, `depth` directories deep
+    """
+    dirs = [f"d{(i // fanout ** level) % fanout}" for level in range(depth)]
+    name = f"{{{{ ght.prefix }}}}-f{i}.txt" if templated else f"f{i}.txt"
+    return "/".join(dirs + [name])
+
+
+def template_content(i, file_size, is_template):
+    """
+    About `file_size` bytes of text, with a Jinja expression on each line when `is_template`
+    """
+    prefix = "{{ ght.name }} renders" if is_template else "plain"
+    lines, size, n = [], 0, 0
+    while size < file_size:
+        text = f"{prefix} line {n} of file {i}\n"
+        lines.append(text)
+        size += len(text)
+        n += 1
+    return "".join(lines)
+
+
+def make_template(
+    path, files=1000, depth=3, file_size=1024, jinja_share=0.5, templated_names=10, fanout=10
+):
+    """
+    Create a single-commit template repository at `path`, and return its file:// url.
+
+    `jinja_share` of the `files` contain Jinja expressions, spread evenly, and the first
+    `templated_names` files have a templated file name.
+    """
+    subprocess.run(["git", "init", "-q", path], check=True)
+    subprocess.run(["git", "-C", path, "config", "uploadpack.allowFilter", "true"], check=True)
+    config = yaml.dump(template_config(path))
+
+    stream = [
+        "commit refs/heads/master\n",
+        "committer Bench <bench@example.com> 0 +0000\n",
+        "data 9\nTemplate\n",
+        f"M 100644 inline .github/ght.yaml\ndata {len(config.encode())}\n{config}\n",
+    ]
+    for i in range(files):
+        is_template = int((i + 1) * jinja_share) > int(i * jinja_share)
+        data = template_content(i, file_size, is_template)
+        file_path = template_path(i, depth, fanout, templated=i < templated_names)
+        stream.append(f"M 100644 inline {file_path}\ndata {len(data.encode())}\n{data}\n")
+
+    subprocess.run(
+        ["git", "-C", path, "fast-import", "--quiet"], input="".join(stream).encode(), check=True
+    )
+    return f"file://{path}"
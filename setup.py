@@ -45,6 +45,13 @@ doc_requirements = [
     # fmt: on
 ]
 
+# `gittr render --watch` waits for changes with watchdog, and polls without it
+watch_requirements = [
+    # fmt: off
+    "watchdog",
+    # fmt: on
+]
+
 
 conda_rosetta_stone = {
     # fmt: off
@@ -91,7 +98,8 @@ setup_kwargs = dict(
     extras_require={
         # fmt: off
         "test": test_requirements,
-        "doc": doc_requirements
+        "doc": doc_requirements,
+        "watch": watch_requirements,
         # fmt: on
     },
     url="https://github.com/zeroae/ght",
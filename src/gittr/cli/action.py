@@ -1,11 +1,160 @@
+import copy
+import hashlib
 import os
-from contextlib import contextmanager
+import re
+import shutil
+import stat
+import tarfile
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from fnmatch import fnmatch
+from io import BytesIO
+from tempfile import SpooledTemporaryFile, TemporaryDirectory
 
 import yaml
 
-from gittr.cli.utils import iterable_converged, RestrictedFileSystemLoader
-from jinja2 import Environment, Template
-from git import Repo, Actor
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeDumper, SafeLoader
+
+from gittr.cli import __version__
+from gittr.cli.cache import (
+    BytecodeCache,
+    LRUCache,
+    RenderCache,
+    TemplateMirrors,
+    config_hash,
+    is_cacheable,
+)
+from gittr.cli.constants import FETCH_STRATEGIES
+from gittr.cli.trace import counter, span, traced
+from gittr.cli.utils import (
+    RestrictedFileSystemLoader,
+    RestrictedTreeLoader,
+    batched,
+    checked_out_branches,
+    has_template_delimiters,
+    is_template,
+    referenced_paths,
+    stashed_checkout,
+    templated_values,
+    toposort,
+    worktree_checkout,
+)
+from jinja2 import BaseLoader, Environment, Template
+from git import Repo, Actor, Blob, Commit, Git, GitCommandError, Head, IndexFile, Tree
+from git.index.fun import stat_mode_to_index_mode
+from git.compat import safe_decode
+from git.objects.fun import tree_to_stream
+from git.index.typ import BaseIndexEntry, IndexEntry
+from gitdb import IStream, LooseObjectDB
+
+
+def create_environment(loader: BaseLoader, bytecode_cache=None) -> Environment:
+    """
+    Create the Jinja2 Environment used to render GHT templates
+    """
+    return Environment(
+        loader=loader,
+        bytecode_cache=bytecode_cache,
+        extensions=[
+            "jinja2.ext.do",
+            "jinja2.ext.loopcontrols",
+            "jinja2.ext.with_",
+            "jinja2_time.TimeExtension",
+        ],
+    )
+
+
+def renders_content(path):
+    """
+    True if the content of the blob at `path` is rendered as a template
+    """
+    return not path.startswith(".github/") or path.endswith(".ght")
+
+
+def is_outside_tree(path):
+    """
+    True if the rendered `path` points outside of the tree it is rendered into
+    """
+    return os.path.isabs(path) or os.path.normpath(path).split(os.sep)[0] == ".."
+
+
+def has_invalid_parts(path):
+    """
+    True if the rendered git `path` has an empty, `.` or `..` component, e.g. when it is
+    absolute or escapes the tree
+    """
+    return any(part in ("", ".", "..") for part in path.split("/"))
+
+
+def iter_tree_entries(data: bytes):
+    """
+    Yields the (binsha, mode, name) of the entries of the raw tree `data`; a faster
+    `git.objects.fun.tree_entries_from_data` that does not build the list
+    """
+    start = 0
+    while start < len(data):
+        space = data.index(b" ", start)
+        nul = data.index(b"\0", space)
+        name, binsha, end = space + 1, nul + 1, nul + 21
+        yield data[binsha:end], int(data[start:space], 8), safe_decode(data[name:nul])
+        start = end
+
+
+def parse_trailers(message):
+    """
+    The (key, value) trailers of a commit `message`, from its last paragraph
+    """
+    _, sep, paragraph = message.strip().rpartition("\n\n")
+    trailers = []
+    for line in paragraph.splitlines() if sep else ():
+        key, sep, value = line.partition(": ")
+        if not sep or not key or " " in key:
+            return []
+        trailers.append((key, value))
+    return trailers
+
+
+def render_template(env: Environment, config: dict, working_tree_dir, path):
+    """
+    Render the template at `path` and overwrite it with the results
+
+    The output is streamed to the file, so memory does not grow with the rendered size.
+    """
+    template: Template = env.get_template(path)
+    with open(os.path.join(working_tree_dir, path), "w") as f:
+        template.stream(config).dump(f)
+    return path
+
+
+GHT_CONF_PATH = ".github/ght.yaml"
+COMMIT_SHA = re.compile(r"[0-9a-f]{40}")
+BLOB_CHUNK_SIZE = 64 * 1024
+# Rendered blobs larger than this are spooled to a temporary file before being stored
+BLOB_SPOOL_SIZE = 256 * 1024
+# The blobs of the checkout backend are rendered and staged this many at a time
+RENDER_BATCH_SIZE = 1024
+# The odb backend remembers how this many distinct template blobs were rendered
+RENDERED_BLOB_ENTRIES = 1024
+
+# Per-process state of the render_tree_content worker pool
+_worker_env: Environment = None
+_worker_config: dict = None
+_worker_tree_dir: str = None
+
+
+def _init_render_worker(working_tree_dir, config, bytecode_cache):
+    global _worker_env, _worker_config, _worker_tree_dir
+    _worker_env = create_environment(RestrictedFileSystemLoader(working_tree_dir), bytecode_cache)
+    _worker_config = config
+    _worker_tree_dir = working_tree_dir
+
+
+def _render_worker(path):
+    return render_template(_worker_env, _worker_config, _worker_tree_dir, path)
 
 
 class GHT(object):
@@ -14,6 +163,13 @@ class GHT(object):
     config: dict
     template_url: str
     template_ref: str
+    jobs: int
+    cache: RenderCache
+    mirrors: TemplateMirrors
+    fetch_strategy: str
+    isolation: str
+    stats: Counter
+    template_commits: list
 
     __slots__ = [
         "repo",
@@ -24,12 +180,54 @@ class GHT(object):
         "config_path",
         "template_url",
         "template_ref",
+        "jobs",
+        "cache",
+        "mirrors",
+        "fetch_strategy",
+        "isolation",
+        "stats",
+        "template_commits",
+        "_rendered_names",
+        "_rendered_trees",
+        "_rendered_blobs",
+        "_parsed_configs",
+        "_loose_odb",
     ]
 
-    def __init__(self, repo_path, template_url=None, template_ref="master", config_path=None):
+    def __init__(
+        self,
+        repo_path,
+        template_url=None,
+        template_ref="master",
+        config_path=None,
+        jobs=1,
+        cache: RenderCache = None,
+        mirrors: TemplateMirrors = None,
+        fetch_strategy="auto",
+        isolation="worktree",
+        parsed_configs=None,
+    ):
         self.repo = Repo(path=repo_path)
         self.template_url = template_url
         self.template_ref = template_ref
+        self.jobs = jobs
+        self.cache = cache
+        self.mirrors = mirrors
+        self.fetch_strategy = fetch_strategy
+        self.isolation = isolation
+        self.stats = Counter()
+        # The (url, commit sha) of each template layer, once fetched
+        self.template_commits = []
+        self._rendered_names = {}
+        self._rendered_trees = {}
+        # The (binsha, rendered) of template blobs by binsha, see `render_blob`
+        self._rendered_blobs = LRUCache(RENDERED_BLOB_ENTRIES)
+        # The parsed ght.yaml by content hash, see `parse_config`; may be shared between GHTs
+        self._parsed_configs = {} if parsed_configs is None else parsed_configs
+
+        # Writes loose objects in-process, in small chunks, instead of spawning `git hash-object`
+        self._loose_odb = LooseObjectDB(self.repo.odb.root_path())
+        self._loose_odb.stream_chunk_size = BLOB_CHUNK_SIZE
         self.config_path = config_path or os.path.join(
             self.repo.working_tree_dir, ".github", "ght.yaml"
         )
@@ -37,154 +235,1041 @@ class GHT(object):
         self.committer = Actor("GHT", "ght@zero-ae.com")
         self.author = self.committer
 
-        self.env = Environment(
-            loader=RestrictedFileSystemLoader(self.repo.working_tree_dir),
-            extensions=[
-                "jinja2.ext.do",
-                "jinja2.ext.loopcontrols",
-                "jinja2.ext.with_",
-                "jinja2_time.TimeExtension",
-            ],
-        )
+        self.env = create_environment(RestrictedFileSystemLoader(self.repo.working_tree_dir))
 
-    def load_config(self):
-        if not os.path.exists(self.config_path):
-            raise ValueError(
-                f"{self.repo.working_tree_dir} is an invalid GHT repository, "
-                "{self.config_path} does not exist."
-            )
-        with open(self.config_path, "r") as f:
-            self.config = yaml.safe_load(f)
-            self.template_url = self.template_url or self.config["ght"].get("template", {}).get(
-                "url", None
-            )
+    @traced
+    def load_config(self, content=None):
+        """
+        Load the configuration from `config_path`, or from `content` when it is given.
+        """
+        if content is None:
+            if not os.path.exists(self.config_path):
+                raise ValueError(
+                    f"{self.repo.working_tree_dir} is an invalid GHT repository, "
+                    "{self.config_path} does not exist."
+                )
+            with open(self.config_path, "r") as f:
+                content = f.read()
+        self.config = self.parse_config(content)
+        self._rendered_names.clear()
+        self._rendered_trees.clear()
+        self._rendered_blobs.clear()
+        self.template_url = self.template_url or self.config["ght"].get("template", {}).get(
+            "url", None
+        )
+        if self.template_url is None and self.config["ght"].get("templates"):
+            self.template_url = self.config["ght"]["templates"][-1]["url"]
         with self.repo.config_reader() as cr:
             if cr.has_section("user"):
                 if cr.has_option("user", "name") and cr.has_option("user", "email"):
                     self.author = Actor(cr.get_value("user", "name"), cr.get_value("user", "email"))
 
+    def parse_config(self, content):
+        """
+        Parse a ght.yaml, with libyaml when it is available.
+
+        The parsed configurations are kept by content hash, so the same file is only parsed
+        once; callers get their own copy, as resolving a configuration changes it in place.
+        """
+        digest = hashlib.sha256(content.encode("utf-8")).digest()
+        config = self._parsed_configs.get(digest)
+        if config is None:
+            config = self._parsed_configs[digest] = yaml.load(content, Loader=SafeLoader)
+        return copy.deepcopy(config)
+
+    @traced
     def prepare_tree_for_rendering(self):
         """
-        git rm -rf .
-        git checkout ght/template -- .
-        git branch -D ght/template
+        git read-tree --reset -u <template tree>
         git checkout HEAD -- .github/ght.yaml
-        """
-        self.remove_all()
 
-        with self.fetch_template():
-            self.repo.git.checkout("ght/template", "--", ".")
+        The index and the working tree are switched to the template in one pass: the tracked
+        files missing from the template are removed, and the others are overwritten.
+        """
+        self.repo.git.read_tree("--reset", "-u", self.fetch_template_tree().hexsha)
 
         self.repo.git.checkout("HEAD", "--", ".github/ght.yaml")
 
+    def resolve_fetch_strategy(self, default):
+        """
+        The `fetch_strategy`, then `ght.template.fetch` from the configuration, then `default`
+        """
+        if self.fetch_strategy != "auto":
+            return self.fetch_strategy
+        config = getattr(self, "config", None) or {}
+        strategy = config.get("ght", {}).get("template", {}).get("fetch", "auto")
+        if strategy not in FETCH_STRATEGIES:
+            raise ValueError(
+                f"ght.template.fetch must be one of {', '.join(FETCH_STRATEGIES)}: {strategy}"
+            )
+        return default if strategy == "auto" else strategy
+
     @contextmanager
     def fetch_template(self):
-        self.repo.git.fetch(self.template_url, "--no-tags", f"{self.template_ref}:ght/template")
+        """
+        Fetch `template_ref` into the ght/template branch, through the template mirror when
+        `mirrors` is set.
+
+        Only the tip commit is fetched, unless the fetch strategy is `full`.
+        """
+        url = self.template_url
+        if self.mirrors is not None:
+            url = self.mirrors.update(url)
+        depth = [] if self.resolve_fetch_strategy("shallow") == "full" else ["--depth", "1"]
+        with span("GHT.fetch_template", url=self.template_url, ref=self.template_ref):
+            self.repo.git.fetch(url, "--no-tags", *depth, f"{self.template_ref}:ght/template")
         yield
         self.repo.git.branch("-D", "ght/template")
 
-    def remove_all(self):
+    def template_layers(self):
         """
-        Does the equivalent of `git rm -rf .`
+        The (url, ref) of each template, from the bottom to the top layer.
+
+        The layers are listed in `ght.templates`; without it, the single template is
+        `template_url` at `template_ref`.
         """
-        all_blobs = [
-            o.path
-            for o in self.repo.tree().traverse(
-                predicate=lambda i, _: i.type == "blob", branch_first=False
-            )
-        ]
-        for path in all_blobs:
-            fs_path = os.path.join(self.repo.working_tree_dir, path)
-            os.remove(fs_path)
-        self.repo.index.remove(all_blobs)
-        all_trees = [
-            o.path
-            for o in self.repo.tree().traverse(
-                predicate=lambda i, _: i.type == "tree", branch_first=False
+        templates = self.config["ght"].get("templates") if getattr(self, "config", None) else None
+        if not templates:
+            return [(self.template_url, self.template_ref)]
+        return [(t["url"], t.get("ref", self.template_ref)) for t in templates]
+
+    def fetch_template_tree(self) -> Tree:
+        """
+        Fetch the template and return its Tree, the fetched commits are kept in
+        `template_commits`.
+
+        With several template layers, the Tree is their overlay, see `overlay_trees`.
+        """
+        layers = self.template_layers()
+        if len(layers) == 1:
+            with self.fetch_template():
+                commits = [self.repo.commit("ght/template")]
+                self.template_commits = [(layers[0][0], commits[0].hexsha)]
+                return commits[0].tree
+        with self.fetch_templates() as commits:
+            self.template_commits = [(url, c.hexsha) for (url, _), c in zip(layers, commits)]
+            return self.overlay_trees([commit.tree for commit in commits])
+
+    @contextmanager
+    def fetch_templates(self):
+        """
+        Fetch every template layer into a ght/template-N branch, yields their commits.
+
+        The layers are fetched concurrently into the template mirrors, or into temporary
+        repositories without `mirrors`, and then copied into this repository one at a time:
+        concurrent shallow fetches into the same repository race on its shallow file.
+        """
+        layers = self.template_layers()
+        depth = [] if self.resolve_fetch_strategy("shallow") == "full" else ["--depth", "1"]
+
+        with TemporaryDirectory(prefix="gittr-templates-") as tmp_dir:
+
+            def stage(i):
+                url, ref = layers[i]
+                with span("GHT.fetch_templates.stage", url=url, ref=ref):
+                    if self.mirrors is not None:
+                        return self.mirrors.update(url), ref
+                    path = os.path.join(tmp_dir, str(i))
+                    Git().init("--bare", "--quiet", path)
+                    Git(path).fetch(url, "--no-tags", *depth, f"{ref}:refs/heads/template")
+                    return path, "template"
+
+            with ThreadPoolExecutor(max_workers=len(layers)) as pool:
+                staged = list(pool.map(stage, range(len(layers))))
+
+            branches = []
+            try:
+                for i, ((url, ref), (path, staged_ref)) in enumerate(zip(layers, staged)):
+                    with span("GHT.fetch_template", url=url, ref=ref):
+                        self.repo.git.fetch(
+                            path, "--no-tags", *depth, f"{staged_ref}:ght/template-{i}"
+                        )
+                    branches.append(f"ght/template-{i}")
+                yield [self.repo.commit(branch) for branch in branches]
+            finally:
+                if branches:
+                    self.repo.git.branch("-D", *branches)
+
+    @traced
+    def overlay_trees(self, trees):
+        """
+        Write the overlay of `trees`, from the bottom to the top layer, and return its Tree.
+
+        The files of a layer replace the files at the same path in the layers below it. A file
+        also replaces a directory at its path, and a directory a file, so each layer can turn
+        one into the other.
+        """
+        entries = {}
+        for tree in trees:
+            layer = {
+                path: entry for (path, _), entry in IndexFile.new(self.repo, tree).entries.items()
+            }
+            directories = set()
+            for path in layer:
+                parts = path.split("/")
+                directories.update("/".join(parts[:i]) for i in range(1, len(parts)))
+
+            def is_replaced(path):
+                if path in directories:
+                    return True
+                parts = path.split("/")
+                return any("/".join(parts[:i]) in layer for i in range(1, len(parts)))
+
+            entries = {path: entry for path, entry in entries.items() if not is_replaced(path)}
+            entries.update(layer)
+
+        index = IndexFile.new(self.repo, trees[-1])
+        index.entries = {(path, 0): entry for path, entry in entries.items()}
+        return index.write_tree()
+
+    @traced
+    def fetch_template_config(self) -> bytes:
+        """
+        Returns the template's .github/ght.yaml, transferring only the tip commit, its trees,
+        and that one blob.
+
+        The fetch goes through a temporary partial clone, so the repository is not turned
+        into a promisor. Servers without filter support send the tip blobs too.
+        """
+        with TemporaryDirectory() as tmp_dir:
+            git = Git(tmp_dir)
+            git.init("--bare")
+            git.remote("add", "origin", self.template_url)
+            git.config("remote.origin.promisor", "true")
+            git.config("remote.origin.partialclonefilter", "blob:none")
+            git.fetch(
+                "--depth", "1", "--filter=blob:none", "--no-tags", "origin", self.template_ref
             )
-        ]
-        all_trees.reverse()
-        for path in all_trees:
-            os.rmdir(os.path.join(self.repo.working_tree_dir, path))
-        self.repo.index.update()
+            tmp_repo = Repo(tmp_dir)
+            try:
+                blob: Blob = tmp_repo.commit("FETCH_HEAD").tree / ".github/ght.yaml"
+                return blob.data_stream.read()
+            finally:
+                tmp_repo.close()
 
+    @traced
     def render_ght_conf(self):
         """
         Render the .github/ght.yaml file
         """
         ght_conf_path = os.path.join(self.repo.working_tree_dir, ".github", "ght.yaml")
         with open(ght_conf_path) as f:
-            curr_ght_yaml = f.read().splitlines()
-        next_ght_yaml = curr_ght_yaml
-
-        converged, index = False, -1
-        while not converged:
-            curr_ght_yaml = next_ght_yaml[: index + 1] + curr_ght_yaml[index + 1 :]  # noqa: E203
-            config = yaml.safe_load("\n".join(curr_ght_yaml))
-            next_ght_yaml = [self.env.from_string(line).render(config) for line in curr_ght_yaml]
-            converged, index = iterable_converged(curr_ght_yaml, next_ght_yaml)
+            ght_yaml = f.read()
 
         with open(ght_conf_path, "w") as f:
-            f.write("\n".join(curr_ght_yaml))
+            f.write(self.render_ght_conf_text(ght_yaml))
         self.repo.index.add(".github/ght.yaml")
 
+    def render_ght_conf_text(self, ght_yaml):
+        """
+        Render the contents of a .github/ght.yaml file
+
+        The configuration values are resolved first, and then each templated line is rendered
+        once with the resolved configuration.
+        """
+        config = self.parse_config(ght_yaml)
+        self.resolve_config(config)
+        return "\n".join(
+            self.from_string(line).render(config) if has_template_delimiters(line) else line
+            for line in ght_yaml.splitlines()
+        )
+
+    def resolve_config(self, config):
+        """
+        Render the template strings of `config` in place.
+
+        Each value is rendered once, after the values it references, e.g. `ght.abcd` after
+        `ght.abc` for `abcd: "{{ght.abc}}/delta"`. Circular references raise a ValueError.
+        """
+        templates = dict(templated_values(config))
+        templates_under = defaultdict(list)
+        for path in templates:
+            for i in range(1, len(path) + 1):
+                templates_under[path[:i]].append(path)
+
+        dependencies = {}
+        for path, source in templates.items():
+            dependencies[path] = deps = set()
+            for ref in referenced_paths(self.env.parse(source)):
+                # A reference to an enclosing mapping, e.g. `ght`, depends on all its values
+                deps.update(p for p in templates_under.get(ref, ()) if p != path or p == ref)
+                # A reference into a value, e.g. `ght.abc.x`, depends on that value
+                deps.update(ref[:i] for i in range(1, len(ref)) if ref[:i] in templates)
+
+        for path in toposort(dependencies, name=lambda p: ".".join(map(str, p))):
+            container = config
+            for key in path[:-1]:
+                container = container[key]
+            container[path[-1]] = self.from_string(templates[path]).render(config)
+
+    @traced
+    def render(self, dest_branch="ght/master", backend="checkout", force=False):
+        """
+        Render the template into `dest_branch` with the `checkout` or the `odb` backend.
+
+        Nothing is fetched nor rendered when `dest_branch` is already a render of the current
+        templates and configuration (see `is_rendered`), unless `force` is set. Returns True if
+        the template was rendered.
+        """
+        if backend == "odb":
+            if not self.repo.head.is_detached and self.repo.active_branch.name == dest_branch:
+                raise ValueError(
+                    f"Refusing to render into the checked out branch `{dest_branch}` "
+                    "with the odb backend."
+                )
+        if not force and self.is_rendered(dest_branch):
+            return False
+
+        if backend == "odb":
+            self.render_tree_objects(dest_branch)
+        else:
+            with self.checkout(dest_branch, paths=()):
+                self.render_tree()
+        counter("files", **self.stats)
+        return True
+
+    @traced
+    def is_rendered(self, branch):
+        """
+        True if the head of `branch` is a render of the current template commits and
+        configuration, going by the provenance trailers of its message.
+
+        The configuration and the gittr version are checked first; the template refs are then
+        resolved without fetching them, see `resolve_template_commit`.
+        """
+        if branch not in self.repo.heads:
+            return False
+        commit = self.repo.heads[branch].commit
+        recorded = parse_trailers(commit.message)
+        try:
+            ght_conf: Blob = commit.tree / GHT_CONF_PATH
+        except KeyError:
+            return False
+        ght_yaml = self.render_ght_conf_text(ght_conf.data_stream.read().decode("utf-8"))
+        config = self.parse_config(ght_yaml)
+
+        expected = self.provenance([], config)
+        if not set(expected) <= set(recorded):
+            return False
+        template_commits = [
+            (url, self.resolve_template_commit(url, ref)) for url, ref in self.template_layers()
+        ]
+        return recorded == self.provenance(template_commits, config)
+
+    def resolve_template_commit(self, url, ref):
+        """
+        The sha of the commit `ref` points to in the template at `url`, or None.
+
+        The ref is resolved in the template mirror when `mirrors` is set, and otherwise with
+        `git ls-remote`, in the order `git fetch` resolves it.
+        """
+        if self.mirrors is not None:
+            try:
+                path = self.mirrors.update(url)
+                return Git(path).rev_parse("--verify", "--quiet", f"{ref}^{{commit}}")
+            except GitCommandError:
+                return None
+        if COMMIT_SHA.fullmatch(ref):
+            return ref
+        refs = dict(
+            reversed(line.split("\t", 1)) for line in Git().ls_remote(url, ref).splitlines()
+        )
+        for name in (ref, f"refs/tags/{ref}^{{}}", f"refs/tags/{ref}", f"refs/heads/{ref}"):
+            if name in refs:
+                return refs[name]
+        return None
+
+    def provenance(self, template_commits, config):
+        """
+        The (key, value) trailers of a render of the (url, commit sha) `template_commits` with
+        `config`
+        """
+        trailers = []
+        for url, sha in template_commits:
+            trailers += [("Ght-Template-Url", url), ("Ght-Template-Commit", sha)]
+        return trailers + [("Ght-Config-Hash", config_hash(config)), ("Ght-Version", __version__)]
+
+    @contextmanager
+    def checkout(self, branch, paths=None):
+        """
+        Work on `branch` for the duration of the context, yields the Repo it is checked out in.
+
+        With the worktree isolation, `branch` is checked out in a temporary worktree and the GHT
+        works there, so the user's working tree is never touched; only `paths` are written out
+        when they are given. With the stash isolation, or when `branch` is already checked out
+        here, the working tree is stashed and `branch` is checked out in place.
+
+        The worktrees left by killed renders are pruned first. Raises ValueError when `branch`
+        is checked out in another worktree.
+        """
+        self.repo.git.worktree("prune")
+        worktree_dir = checked_out_branches(self.repo).get(branch)
+        if worktree_dir is not None and os.path.realpath(worktree_dir) != os.path.realpath(
+            self.repo.working_tree_dir
+        ):
+            raise ValueError(
+                f"Refusing to work on {branch}, it is checked out in another worktree at "
+                f"{worktree_dir}."
+            )
+        if self.isolation == "stash" or worktree_dir is not None:
+            with stashed_checkout(self.repo, branch):
+                yield self.repo
+            return
+
+        repo, config_path, loader = self.repo, self.config_path, self.env.loader
+        with worktree_checkout(repo, branch, paths) as worktree:
+            self.repo = worktree
+            self.config_path = os.path.join(
+                worktree.working_tree_dir, os.path.relpath(config_path, repo.working_tree_dir)
+            )
+            self.env.loader = RestrictedFileSystemLoader(worktree.working_tree_dir)
+            try:
+                yield worktree
+            finally:
+                self.repo, self.config_path, self.env.loader = repo, config_path, loader
+
+    @traced
     def render_tree(self):
         self.prepare_tree_for_rendering()
         self.render_ght_conf()
         self.load_config()
         self.render_tree_content()
-        self.repo.index.commit(
-            f"[ght]: rendered {self.template_url} content",
-            skip_hooks=True,
-            author=self.author,
-            committer=self.committer,
-        )
+        self.commit_index(self.render_message("content"))
         self.render_tree_structure()
+        self.commit_index(self.render_message("structure"))
+
+    def render_message(self, step):
+        """
+        The message of the `content` or `structure` render commit, with the provenance of the
+        render as trailers
+        """
+        urls = ", ".join(url for url, _ in self.template_layers())
+        trailers = "\n".join(
+            f"{key}: {value}" for key, value in self.provenance(self.template_commits, self.config)
+        )
+        return f"[ght]: rendered {urls} {step}\n\n{trailers}"
+
+    @traced
+    def commit_index(self, message):
+        """
+        Commit the index onto the checked out branch, as the GHT
+        """
         self.repo.index.commit(
-            f"[ght]: rendered {self.template_url} structure",
-            skip_hooks=True,
+            message, skip_hooks=True, author=self.author, committer=self.committer
+        )
+
+    @traced
+    def render_tree_objects(self, branch="ght/master"):
+        """
+        Render the template straight into the object database.
+
+        The template blobs are read from the fetched commit and rendered in memory; the blobs,
+        trees and the two `[ght]: rendered ...` commits are written without touching the
+        working tree or the index, and `branch` is moved to the structure commit.
+
+        Both commits are built by walking the template's trees depth first, so memory grows
+        with the depth and width of the tree rather than with its number of files, and the
+        subtrees that do not change are reused as they are.
+        """
+        head: Head = self.repo.heads[branch]
+
+        template_tree = self.fetch_template_tree()
+
+        ght_conf: Blob = head.commit.tree / GHT_CONF_PATH
+        ght_yaml = self.render_ght_conf_text(ght_conf.data_stream.read().decode("utf-8"))
+        ght_conf_entry = (self.store_blob(ght_yaml.encode("utf-8")), ght_conf.mode)
+        self.load_config(ght_yaml)
+
+        env = create_environment(RestrictedTreeLoader(template_tree), self.env.bytecode_cache)
+        digest = config_hash(self.config) if self.cache is not None else None
+        content = self.render_content_tree(
+            template_tree.binsha, "", env, digest, {GHT_CONF_PATH: ght_conf_entry}
+        )
+        self.commit_objects(Tree(self.repo, content), head, self.render_message("content"))
+
+        structure = self.render_structure_tree(content, "")
+        self.commit_objects(Tree(self.repo, structure), head, self.render_message("structure"))
+
+    def tree_entries(self, binsha):
+        """
+        The (binsha, mode, name) of the entries of the tree `binsha`, None for an empty tree
+        """
+        if binsha is None:
+            return iter(())
+        return iter_tree_entries(self.repo.odb.stream(binsha).read())
+
+    def store_tree(self, entries) -> bytes:
+        """
+        Write a tree of (binsha, mode, name) `entries` to the object database
+        """
+        entries = sorted(entries, key=lambda e: e[2] + "/" if stat.S_ISDIR(e[1]) else e[2])
+        stream = BytesIO()
+        tree_to_stream(entries, stream.write)
+        size = stream.tell()
+        stream.seek(0)
+        return self._loose_odb.store(IStream(Tree.type, size, stream)).binsha
+
+    def render_content_tree(self, binsha, path, env, digest, overrides):
+        """
+        Render the content of the blobs under the tree `binsha` at `path`, returns the binsha
+        of the rendered tree.
+
+        `overrides` maps the paths of blobs to (binsha, mode) entries that replace them, or
+        that are added when the template has no such blob.
+        """
+        entries, changed = [], False
+        for entry_binsha, mode, name in self.tree_entries(binsha):
+            entry_path = path + name
+            if stat.S_ISDIR(mode):
+                rendered = self.render_content_tree(
+                    entry_binsha, entry_path + "/", env, digest, overrides
+                )
+            elif entry_path in overrides:
+                rendered, mode = overrides[entry_path]
+            elif renders_content(entry_path) and stat.S_ISREG(mode):
+                rendered = self.render_blob(entry_path, entry_binsha, env, digest)
+            else:
+                rendered = entry_binsha
+            changed = changed or rendered != entry_binsha
+            entries.append((rendered, mode, name))
+
+        # The overrides missing from the template, e.g. a template without .github/ght.yaml
+        names = {name for _, _, name in entries}
+        for override_path in overrides:
+            if not override_path.startswith(path):
+                continue
+            name, _, rest = override_path.replace(path, "", 1).partition("/")
+            if name in names:
+                continue
+            names.add(name)
+            if rest:
+                subtree = self.render_content_tree(None, path + name + "/", env, digest, overrides)
+                entries.append((subtree, stat.S_IFDIR, name))
+            else:
+                override_binsha, override_mode = overrides[override_path]
+                entries.append((override_binsha, override_mode, name))
+            changed = True
+        return self.store_tree(entries) if changed else binsha
+
+    def render_blob(self, path, binsha, env, digest):
+        """
+        Render the template blob `binsha` at `path`, returns the binsha of the rendered blob.
+
+        Blobs that do not need rendering (see `needs_rendering`) are returned unchanged.
+        Identical blobs, e.g. empty files, are only read and rendered once, unless a
+        `ght.template` glob applies to their path.
+        """
+        memoized = self.template_glob_rule(path) is None
+        if memoized:
+            rendered, stat_name = self._rendered_blobs.get(binsha, (None, None))
+            if rendered is not None:
+                self.stats[stat_name] += 1
+                return rendered
+
+        stream = self.repo.odb.stream(binsha)
+        needs_rendering = self.needs_rendering(path, stream)
+        while stream.read(BLOB_CHUNK_SIZE):
+            pass
+        if not needs_rendering:
+            rendered, stat_name = binsha, "copied"
+        else:
+            cache_key, rendered = self.lookup_rendered_blob(binsha, digest)
+            if rendered is None:
+                rendered = self.store_rendered_blob(env.get_template(path))
+                self.cache_rendered_blob(cache_key, binsha, rendered)
+                stat_name = "rendered"
+            else:
+                stat_name = "cached"
+            self.stats[stat_name] += 1
+        if memoized:
+            self._rendered_blobs[binsha] = (rendered, stat_name)
+        return rendered
+
+    def render_structure_tree(self, binsha, path):
+        """
+        Render the names of the entries under the tree `binsha` at `path`, returns the binsha
+        of the renamed tree.
+
+        A name may render to a nested path, e.g. `{{ght.abc}}` to `alpha/beta/charlie`, and
+        trees that end up with the same name are merged.
+        """
+        entries, changed = {}, False
+        for entry_binsha, mode, name in self.tree_entries(binsha):
+            rendered = entry_binsha
+            if stat.S_ISDIR(mode):
+                rendered = self.render_structure_tree(entry_binsha, path + name + "/")
+            new_name = self.render_ght_obj_name(name)
+            parts = new_name.split("/")
+            if new_name != name and has_invalid_parts(new_name):
+                raise ValueError(
+                    f"Refusing to render {path}{name} outside of the tree: {path}{new_name}"
+                )
+            for part in reversed(parts[1:]):
+                rendered, mode = self.store_tree([(rendered, mode, part)]), stat.S_IFDIR
+            self.add_tree_entry(entries, parts[0], rendered, mode)
+            changed = changed or new_name != name or rendered != entry_binsha
+        if not changed:
+            return binsha
+        return self.store_tree((b, m, n) for n, (b, m) in entries.items())
+
+    def add_tree_entry(self, entries, name, binsha, mode):
+        """
+        Add an entry to the {name: (binsha, mode)} of a tree, merging it with a tree of the
+        same name; otherwise the last entry with a name wins, as in the index.
+        """
+        previous = entries.get(name)
+        if previous is not None and stat.S_ISDIR(previous[1]) and stat.S_ISDIR(mode):
+            merged = {}
+            for tree_binsha in (previous[0], binsha):
+                for entry_binsha, entry_mode, entry_name in self.tree_entries(tree_binsha):
+                    self.add_tree_entry(merged, entry_name, entry_binsha, entry_mode)
+            binsha = self.store_tree((b, m, n) for n, (b, m) in merged.items())
+        entries[name] = (binsha, mode)
+
+    def walk_blobs(self, binsha, path="", rendered_path=""):
+        """
+        Yield the (path, rendered path, mode, binsha) of each blob under the tree `binsha`,
+        depth first and in rendered path order, holding one sorted tree per level in memory.
+
+        The order is only approximate where several entries of a tree render to the same
+        directory: their blobs come one entry after the other.
+        """
+        entries = sorted(
+            (
+                (self.render_ght_obj_name(name), entry_binsha, mode, name)
+                for entry_binsha, mode, name in self.tree_entries(binsha)
+            ),
+            key=lambda e: e[0] + "/" if stat.S_ISDIR(e[2]) else e[0],
+        )
+        for rendered_name, entry_binsha, mode, name in entries:
+            if stat.S_ISDIR(mode):
+                yield from self.walk_blobs(
+                    entry_binsha, f"{path}{name}/", f"{rendered_path}{rendered_name}/"
+                )
+            else:
+                yield path + name, rendered_path + rendered_name, mode, entry_binsha
+
+    def render_files(self, branch="ght/master"):
+        """
+        Yield the (path, mode, size, stream) of each rendered file, in rendered path order,
+        without writing any object, index entry or commit.
+
+        The configuration is rendered from .github/ght.yaml in `branch`. Copied blobs are
+        streamed from the object database and rendered templates are spooled, one at a time;
+        each stream is only valid until the next file is requested. The template's trees are
+        walked depth first (see `walk_blobs`), so memory grows with the width and depth of the
+        tree rather than with its number of files.
+        """
+        template_tree = self.fetch_template_tree()
+
+        ght_conf: Blob = self.repo.heads[branch].commit.tree / GHT_CONF_PATH
+        ght_yaml = self.render_ght_conf_text(ght_conf.data_stream.read().decode("utf-8"))
+        self.load_config(ght_yaml)
+        ght_yaml = ght_yaml.encode("utf-8")
+        ght_conf_file = (ght_conf.path, ght_conf.mode, len(ght_yaml), BytesIO(ght_yaml))
+
+        env = create_environment(RestrictedTreeLoader(template_tree), self.env.bytecode_cache)
+        for template_path, path, mode, binsha in self.walk_blobs(template_tree.binsha):
+            # The rendered configuration replaces the template's, at its place in the order
+            if ght_conf_file is not None and path >= GHT_CONF_PATH:
+                yield ght_conf_file
+                ght_conf_file = None
+            if template_path == GHT_CONF_PATH:
+                continue
+            if is_outside_tree(path):
+                raise ValueError(f"Refusing to render {template_path} outside of the tree: {path}")
+
+            needs_rendering = False
+            if renders_content(template_path) and stat.S_ISREG(mode):
+                stream = self.repo.odb.stream(binsha)
+                needs_rendering = self.needs_rendering(template_path, stream)
+                while stream.read(BLOB_CHUNK_SIZE):
+                    pass
+            if not needs_rendering:
+                stream = self.repo.odb.stream(binsha)
+                yield path, mode, stream.size, stream
+                continue
+
+            with SpooledTemporaryFile(max_size=BLOB_SPOOL_SIZE) as f:
+                for chunk in env.get_template(template_path).generate(self.config):
+                    f.write(chunk.encode("utf-8"))
+                size = f.tell()
+                f.seek(0)
+                self.stats["rendered"] += 1
+                yield path, mode, size, f
+        if ght_conf_file is not None:
+            yield ght_conf_file
+
+    @traced
+    def render_tar(self, fileobj, branch="ght/master"):
+        """
+        Write the rendered files to `fileobj` as a tar stream, see `render_files`
+
+        The files are dated from the newest template commit, so the same render always
+        writes the same archive.
+        """
+        mtime = None
+        with tarfile.open(fileobj=fileobj, mode="w|") as tar:
+            for path, mode, size, stream in self.render_files(branch):
+                if mtime is None:
+                    mtime = max(
+                        self.repo.commit(sha).committed_date for _, sha in self.template_commits
+                    )
+                info = tarfile.TarInfo(path)
+                info.mtime = mtime
+                if stat.S_ISLNK(mode):
+                    info.type = tarfile.SYMTYPE
+                    info.linkname = stream.read().decode("utf-8")
+                    tar.addfile(info)
+                else:
+                    info.mode = 0o755 if mode & stat.S_IXUSR else 0o644
+                    info.size = size
+                    tar.addfile(info, stream)
+
+    @traced
+    def render_dir(self, directory, branch="ght/master"):
+        """
+        Write the rendered files under `directory`, see `render_files`
+        """
+        for path, mode, size, stream in self.render_files(branch):
+            target = os.path.join(directory, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.lexists(target):
+                os.remove(target)
+            if stat.S_ISLNK(mode):
+                os.symlink(stream.read().decode("utf-8"), target)
+                continue
+            with open(target, "wb") as f:
+                shutil.copyfileobj(stream, f, BLOB_CHUNK_SIZE)
+            os.chmod(target, 0o755 if mode & stat.S_IXUSR else 0o644)
+
+    def store_blob(self, data: bytes) -> bytes:
+        """
+        Write `data` to the object database and return the blob's binary sha
+        """
+        return self.store_blob_stream(BytesIO(data), len(data))
+
+    def store_blob_stream(self, stream, size) -> bytes:
+        """
+        Write `size` bytes read from `stream` to the object database, in chunks
+        """
+        return self._loose_odb.store(IStream(Blob.type, size, stream)).binsha
+
+    @traced
+    def stage_files(self, index: IndexFile, paths):
+        """
+        Like `index.add(paths)`, but the files are hashed in-process and in chunks. The index
+        is not written.
+        """
+        for path in paths:
+            fs_path = os.path.join(self.repo.working_tree_dir, path)
+            st = os.lstat(fs_path)
+            with open(fs_path, "rb") as f:
+                binsha = self.store_blob_stream(f, st.st_size)
+            index.entries[(path, 0)] = IndexEntry.from_base(
+                BaseIndexEntry((stat_mode_to_index_mode(st.st_mode), binsha, 0, path))
+            )
+
+    def store_rendered_blob(self, template: Template) -> bytes:
+        """
+        Render `template` into the object database, spooling large outputs to disk so
+        memory stays bounded regardless of the rendered size.
+        """
+        with SpooledTemporaryFile(max_size=BLOB_SPOOL_SIZE) as f:
+            for chunk in template.generate(self.config):
+                f.write(chunk.encode("utf-8"))
+            size = f.tell()
+            f.seek(0)
+            return self.store_blob_stream(f, size)
+
+    def needs_rendering(self, path, stream):
+        """
+        True if the blob at `path`, read from `stream`, goes through Jinja2.
+
+        The `ght.template.exclude` and `ght.template.include` globs take precedence; otherwise
+        binary blobs and blobs without Jinja2 delimiters are copied unchanged.
+        """
+        rv = self.template_glob_rule(path)
+        if rv is None:
+            rv = is_template(stream)
+        if not rv:
+            self.stats["copied"] += 1
+        return rv
+
+    def template_glob_rule(self, path):
+        """
+        False if a `ght.template.exclude` glob matches `path`, True if an include glob does,
+        and None when neither applies
+        """
+        template = self.config["ght"].get("template", {})
+        if any(fnmatch(path, pattern) for pattern in template.get("exclude", ())):
+            return False
+        if any(fnmatch(path, pattern) for pattern in template.get("include", ())):
+            return True
+        return None
+
+    def has_object(self, binsha: bytes):
+        try:
+            self.repo.odb.info(binsha)
+            return True
+        except ValueError:
+            return False
+
+    def lookup_rendered_blob(self, template_binsha: bytes, digest):
+        """
+        Returns (cache_key, binsha) for a template blob, binsha is None on a cache miss
+        """
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.key(template_binsha, digest)
+        return cache_key, self.cache.get(cache_key, valid=self.has_object)
+
+    def cache_rendered_blob(self, cache_key, template_binsha: bytes, binsha: bytes):
+        """
+        Remember that `template_binsha` rendered to `binsha`, unless the template's output
+        depends on more than its own source and the configuration.
+        """
+        if cache_key is not None and is_cacheable(self.repo.odb.stream(template_binsha).read()):
+            self.cache.put(cache_key, binsha)
+
+    @traced
+    def commit_objects(self, tree: Tree, head: Head, message):
+        """
+        Commit `tree` on top of `head` without touching HEAD or the working tree
+        """
+        commit = Commit.create_from_tree(
+            self.repo,
+            tree,
+            message,
+            parent_commits=[head.commit],
+            head=False,
             author=self.author,
             committer=self.committer,
         )
+        head.set_commit(commit, logmsg=message)
+        return commit
+
+    @traced
+    def merge(self, commit="ght/master", branch="master"):
+        """
+        Merge `commit` into `branch` without checking `branch` out, returns the merge Commit,
+        or None when `branch` already contains `commit`.
+
+        The merge is computed in memory by `git merge-tree --write-tree`, and committed as the
+        user, without hooks. When `branch` is the current branch, the index and the
+        working tree are moved to the merge like `git merge` does, keeping the local changes
+        to the files the merge leaves alone. Conflicts raise a ValueError listing them.
+        """
+        ours, theirs = self.repo.commit(branch), self.repo.commit(commit)
+        if self.repo.is_ancestor(theirs, ours):
+            return None
+        is_current = not self.repo.head.is_detached and self.repo.head.ref.name == branch
+        if not is_current and branch in checked_out_branches(self.repo):
+            raise ValueError(f"Refusing to merge into {branch}, it is checked out in a worktree.")
+
+        status, output, stderr = self.repo.git.merge_tree(
+            "--write-tree",
+            "--name-only",
+            ours.hexsha,
+            theirs.hexsha,
+            with_extended_output=True,
+            with_exceptions=False,
+        )
+        if status not in (0, 1):
+            raise ValueError(f"Could not merge {commit} into {branch}: {stderr.strip()}")
+        files, _, messages = output.partition("\n\n")
+        tree, *conflicts = files.splitlines()
+        if conflicts:
+            listed = "".join(f"  {path}\n" for path in conflicts)
+            raise ValueError(
+                f"Merging {commit} into {branch} conflicts in:\n{listed}{messages.strip()}"
+            )
+
+        kind = "branch" if commit in self.repo.heads else "commit"
+        message = f"Merge {kind} '{commit}'" + ("" if branch == "master" else f" into {branch}")
+        merge = Commit.create_from_tree(
+            self.repo, self.repo.tree(tree), message, parent_commits=[ours, theirs], head=False
+        )
+
+        if is_current:
+            self.repo.git.update_index("-q", "--refresh", with_exceptions=False)
+            status, _, stderr = self.repo.git.read_tree(
+                "-m",
+                "-u",
+                ours.hexsha,
+                merge.hexsha,
+                with_extended_output=True,
+                with_exceptions=False,
+            )
+            if status != 0:
+                raise ValueError(f"Could not merge {commit} into {branch}: {stderr.strip()}")
+        self.repo.git.update_ref(
+            "-m",
+            f"merge {commit}: Merge made by gittr.",
+            f"refs/heads/{branch}",
+            merge.hexsha,
+            ours.hexsha,
+        )
+        return merge
 
+    @traced
     def render_tree_structure(self):
         """
         Renders the Tree structure in git, by applying `render_ght_obj_name` to each object name.
+
+        The renames are applied to the working tree first, and then to the entries of the
+        index in place, with a single write. Nothing is renamed when a rendered path points
+        outside of the tree, or when two entries render to the same path.
+
+        GitPython's IndexFile holds every entry in memory, so with this checkout backend
+        memory still grows with the number of files, and the renames with the number of
+        renamed paths; `render_tree_objects` does not.
         """
-        objs_to_rename = [
-            (o.path, os.path.join(os.path.dirname(o.path), new_name))
-            for o in self.repo.tree().traverse(branch_first=False)
-            if o.name != (new_name := self.render_ght_obj_name(o.name))
-        ]
-        objs_to_rename.reverse()
+        index = self.repo.index
+        renames = []
+        for path, stage in index.entries:
+            new_path = self.render_ght_path(path)
+            if new_path != path:
+                if has_invalid_parts(new_path):
+                    raise ValueError(f"Refusing to render {path} outside of the tree: {new_path}")
+                renames.append(((path, stage), new_path))
 
-        for old_new in objs_to_rename:
-            self.repo.index.move(old_new)
-            self.repo.index.update()
+        # os.renames would overwrite the entry already at a rendered path
+        targets = {}
+        for (path, stage), new_path in renames:
+            target = (new_path, stage)
+            if target in index.entries:
+                other = new_path
+            else:
+                other = targets.setdefault(target, path)
+            if other != path:
+                raise ValueError(
+                    f"Refusing to render {other} and {path} to the same path: {new_path}"
+                )
+
+        for (path, stage), new_path in renames:
+            os.renames(
+                os.path.join(self.repo.working_tree_dir, path),
+                os.path.join(self.repo.working_tree_dir, new_path),
+            )
+            entry = index.entries.pop((path, stage))
+            index.entries[(new_path, stage)] = IndexEntry(entry[:3] + (new_path,) + entry[4:])
+        if renames:
+            index.write(ignore_extension_data=True)
+
+    def render_ght_path(self, path):
+        """
+        Apply `render_ght_obj_name` to each component of a git path.
+
+        The rendered path of each tree is memoized, so the entries of a tree only pay for
+        their own names.
+        """
+        tree, _, name = path.rpartition("/")
+        name = self.render_ght_obj_name(name)
+        return f"{self.render_ght_tree_path(tree)}/{name}" if tree else name
+
+    def render_ght_tree_path(self, tree):
+        try:
+            return self._rendered_trees[tree]
+        except KeyError:
+            rv = self._rendered_trees[tree] = self.render_ght_path(tree)
+            return rv
+
+    def tree_renames(self):
+        """
+        The {path: rendered path} of the trees renamed since the configuration was loaded
+        """
+        return {tree: rv for tree, rv in self._rendered_trees.items() if tree != rv}
 
     def render_ght_obj_name(self, name):
         if name.endswith(".ght"):
             rv = name[:-4]
         else:
             rv = name
-        return self.env.from_string(rv).render(self.config)
+        if not has_template_delimiters(rv):
+            return rv
+        try:
+            return self._rendered_names[rv]
+        except KeyError:
+            rendered = self._rendered_names[rv] = self.from_string(rv).render(self.config)
+            return rendered
 
+    def from_string(self, source) -> Template:
+        """
+        Load a template from a string, through the bytecode cache when there is one
+        """
+        if isinstance(self.env.bytecode_cache, BytecodeCache):
+            return self.env.bytecode_cache.from_string(self.env, source)
+        return self.env.from_string(source)
+
+    @traced
     def render_tree_content(self):
         """
         Render all tree content
+
+        The blobs are rendered and staged `RENDER_BATCH_SIZE` at a time, and the index is
+        written once at the end. When `jobs` is greater than one, the templates are compiled
+        and rendered by a pool of worker processes. The configuration is sent once to each
+        worker.
+
+        With a render `cache`, templates whose rendered blob is already known are restored
+        from the object database instead of going through Jinja. Blobs that do not need
+        rendering (see `needs_rendering`) are left untouched.
         """
-        paths_to_render = [
-            o.path
-            for _, o in self.repo.index.iter_blobs()
-            if not o.path.startswith(".github/") or o.path.endswith(".ght")
-        ]
+        index = self.repo.index
+        digest = config_hash(self.config) if self.cache is not None else None
+        with ExitStack() as stack:
+            pool = None
+            for batch in batched(self.blobs_to_render(index, digest), RENDER_BATCH_SIZE):
+                paths_to_render = [path for path, _, _, cached in batch if not cached]
+                if self.jobs > 1 and len(paths_to_render) > 1:
+                    if pool is None:
+                        pool = stack.enter_context(
+                            ProcessPoolExecutor(
+                                max_workers=self.jobs,
+                                initializer=_init_render_worker,
+                                initargs=(
+                                    self.repo.working_tree_dir,
+                                    self.config,
+                                    self.env.bytecode_cache,
+                                ),
+                            )
+                        )
+                    chunksize = max(1, len(paths_to_render) // (self.jobs * 4))
+                    for _ in pool.map(_render_worker, paths_to_render, chunksize=chunksize):
+                        pass
+                else:
+                    for path in paths_to_render:
+                        render_template(self.env, self.config, self.repo.working_tree_dir, path)
 
-        for path in paths_to_render:
-            template: Template = self.env.get_template(path)
-            rendered = template.render(self.config)
-            with open(os.path.join(self.repo.working_tree_dir, path), "w") as f:
-                f.write(rendered)
-            self.repo.index.add(path)
+                self.stage_files(index, (path for path, _, _, _ in batch))
+                self.stats.update(
+                    rendered=len(paths_to_render), cached=len(batch) - len(paths_to_render)
+                )
+                for path, cache_key, template_binsha, cached in batch:
+                    if not cached:
+                        self.cache_rendered_blob(
+                            cache_key, template_binsha, index.entries[(path, 0)].binsha
+                        )
+        index.write(ignore_extension_data=True)
+
+    def blobs_to_render(self, index: IndexFile, digest):
+        """
+        Yields the (path, cache key, template binsha, cached) of the blobs of `index` that
+        need rendering. The `cached` ones were restored from the render cache to the working
+        tree.
+        """
+        for (path, _), entry in index.entries.items():
+            if not renders_content(path) or not stat.S_ISREG(entry.mode):
+                continue
+            with open(os.path.join(self.repo.working_tree_dir, path), "rb") as f:
+                if not self.needs_rendering(path, f):
+                    continue
+            cache_key, binsha = self.lookup_rendered_blob(entry.binsha, digest)
+            if binsha is not None:
+                with open(os.path.join(self.repo.working_tree_dir, path), "wb") as f:
+                    shutil.copyfileobj(self.repo.odb.stream(binsha), f, BLOB_CHUNK_SIZE)
+            yield path, cache_key, entry.binsha, binsha is not None
 
     @classmethod
     def init(cls, path, config: dict = None, **kwargs):
@@ -202,13 +1287,19 @@ class GHT(object):
         #   if config is a dict, then yaml.dump it
         if config is None:
             # Get the configuration file from the template URL
-            with ght.fetch_template():
-                repo.git.checkout("ght/template", ".github/ght.yaml")
+            if ght.resolve_fetch_strategy("config") == "config" and ght.mirrors is None:
+                os.makedirs(os.path.join(path, ".github"), exist_ok=True)
+                with open(os.path.join(path, ".github", "ght.yaml"), "wb") as f:
+                    f.write(ght.fetch_template_config())
+                repo.index.add(".github/ght.yaml")
+            else:
+                with ght.fetch_template():
+                    repo.git.checkout("ght/template", ".github/ght.yaml")
         elif isinstance(config, dict):
             github_dir = os.path.join(path, ".github")
             os.makedirs(github_dir, exist_ok=True)
             with open(os.path.join(github_dir, "ght.yaml"), "w") as f:
-                yaml.dump(config, f)
+                yaml.dump(config, f, Dumper=SafeDumper)
             repo.index.add(".github/ght.yaml")
         else:
             raise ValueError("config must be None or a dictionary.")
@@ -0,0 +1,183 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from tempfile import TemporaryDirectory
+
+from gittr.cli.action import GHT
+from gittr.cli.cache import (
+    DEFAULT_BYTECODE_CACHE_MB,
+    DEFAULT_RENDER_CACHE_ENTRIES,
+    BytecodeCache,
+    RenderCache,
+    TemplateMirrors,
+    default_cache_dir,
+)
+
+
+class RenderResult(object):
+    """
+    The outcome of rendering one repository
+    """
+
+    path: str
+    seconds: float
+    stats: dict
+    error: str
+    skipped: bool
+
+    __slots__ = ["path", "seconds", "stats", "error", "skipped"]
+
+    def __init__(self, path, seconds, stats=None, error=None, skipped=False):
+        self.path = path
+        self.seconds = seconds
+        self.stats = stats or {}
+        self.error = error
+        self.skipped = skipped
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def repository_paths(patterns=(), manifest=None):
+    """
+    The repository paths matched by the glob `patterns` and listed in the `manifest` file,
+    in order and without duplicates.
+
+    Blank lines and lines starting with # are ignored in the manifest.
+    """
+    patterns = list(patterns)
+    if manifest is not None:
+        with open(manifest) as f:
+            lines = (line.strip() for line in f)
+            patterns.extend(line for line in lines if line and not line.startswith("#"))
+
+    paths = {}
+    for pattern in patterns:
+        matches = sorted(glob.glob(os.path.expanduser(pattern))) or [pattern]
+        for path in matches:
+            paths.setdefault(os.path.realpath(path), None)
+    return list(paths)
+
+
+def template_urls(repo_path):
+    """
+    The url of each template layer of the GHT repository at `repo_path`
+    """
+    try:
+        ght = GHT(repo_path)
+        ght.load_config()
+        return [url for url, _ in ght.template_layers() if url is not None]
+    except Exception:
+        return []
+
+
+def render_repository(
+    repo_path,
+    template_url=None,
+    template_ref="master",
+    dest_branch="ght/master",
+    backend="checkout",
+    mirrors: TemplateMirrors = None,
+    fetch_strategy="auto",
+    isolation="worktree",
+    cache=False,
+    cache_size=DEFAULT_RENDER_CACHE_ENTRIES,
+    bytecode_dir=None,
+    bytecode_cache_size=DEFAULT_BYTECODE_CACHE_MB,
+    bytecode_cache: BytecodeCache = None,
+    parsed_configs=None,
+    force=False,
+) -> RenderResult:
+    """
+    Render the GHT repository at `repo_path`, and return the outcome instead of raising.
+
+    The compiled templates go through `bytecode_cache`, or else a BytecodeCache in
+    `bytecode_dir`; `parsed_configs` may be shared between renders, see `GHT.parse_config`.
+    Repositories that are already rendered are skipped, unless `force` is set.
+    """
+    start = time.perf_counter()
+    ght = None
+    try:
+        ght = GHT(
+            repo_path,
+            template_url=template_url,
+            template_ref=template_ref,
+            mirrors=mirrors,
+            fetch_strategy=fetch_strategy,
+            isolation=isolation,
+            parsed_configs=parsed_configs,
+        )
+        ght.load_config()
+        if ght.template_url is None:
+            raise ValueError("Could not detect the template repository url.")
+        if cache:
+            ght.cache = RenderCache(default_cache_dir(ght.repo), max_entries=cache_size)
+        if bytecode_cache is not None:
+            ght.env.bytecode_cache = bytecode_cache
+        elif bytecode_dir is not None:
+            ght.env.bytecode_cache = BytecodeCache(
+                bytecode_dir, max_bytes=bytecode_cache_size * 1024 * 1024
+            )
+        rendered = ght.render(dest_branch, backend, force=force)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        return RenderResult(repo_path, time.perf_counter() - start, error=error)
+    finally:
+        if ght is not None and ght.cache is not None:
+            ght.cache.close()
+    return RenderResult(
+        repo_path, time.perf_counter() - start, stats=dict(ght.stats), skipped=not rendered
+    )
+
+
+def render_repositories(
+    repo_paths,
+    jobs=1,
+    mirrors: TemplateMirrors = None,
+    bytecode_dir=None,
+    bytecode_cache_size=DEFAULT_BYTECODE_CACHE_MB,
+    **kwargs,
+):
+    """
+    Render the GHT repositories in `repo_paths` with up to `jobs` worker processes, and
+    yield a RenderResult for each repository as it completes.
+
+    Every template url is fetched once into a mirror before the renders start, and the renders
+    share the compiled templates through the bytecode cache in `bytecode_dir`. Both default to
+    a temporary directory that only lives for this batch.
+
+    The other keyword arguments are passed on to `render_repository`.
+    """
+    with TemporaryDirectory(prefix="gittr-batch-") as tmp_dir:
+        if mirrors is None:
+            mirrors = TemplateMirrors(os.path.join(tmp_dir, "mirrors"), ttl=float("inf"))
+        if bytecode_dir is None:
+            bytecode_dir = os.path.join(tmp_dir, "bytecode")
+
+        urls = {url for path in repo_paths for url in template_urls(path)}
+        for url in sorted(urls):
+            try:
+                mirrors.update(url)
+            except Exception:
+                # The repositories using `url` report the failure when they fetch it themselves
+                pass
+
+        render = partial(
+            render_repository,
+            mirrors=mirrors,
+            bytecode_dir=bytecode_dir,
+            bytecode_cache_size=bytecode_cache_size,
+            **kwargs,
+        )
+        if jobs == 1 or len(repo_paths) <= 1:
+            yield from map(render, repo_paths)
+        else:
+            with ProcessPoolExecutor(min(jobs, len(repo_paths))) as executor:
+                futures = [executor.submit(render, path) for path in repo_paths]
+                for future in as_completed(futures):
+                    yield future.result()
+
+        BytecodeCache(bytecode_dir, max_bytes=bytecode_cache_size * 1024 * 1024).prune()
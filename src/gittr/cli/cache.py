@@ -0,0 +1,365 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from fnmatch import fnmatch
+
+import jinja2
+from git import Git
+from jinja2 import Environment, FileSystemBytecodeCache, Template
+from jinja2.bccache import Bucket
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from gittr.cli import __version__
+from gittr.cli.constants import (
+    DEFAULT_BYTECODE_CACHE_MB,
+    DEFAULT_MIRROR_TTL,
+    DEFAULT_RENDER_CACHE_ENTRIES,
+)
+
+# Templates that pull in other templates, or the current time, do not render to a function of
+# their own blob and the configuration, so their results are never cached.
+_UNCACHEABLE = re.compile(rb"{%[-+]?\s*(?:include|import|extends|from|now)\b")
+
+
+def default_cache_dir(repo):
+    """
+    The gittr cache directory, $GITTR_CACHE_DIR or .git/gittr-cache
+    """
+    return os.environ.get("GITTR_CACHE_DIR", os.path.join(repo.git_dir, "gittr-cache"))
+
+
+@contextmanager
+def locked(path):
+    """
+    An exclusive inter-process lock on the file at `path`
+    """
+    with open(path, "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def config_hash(config: dict):
+    """
+    A stable hash of a rendered configuration
+    """
+    data = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(source: bytes):
+    return _UNCACHEABLE.search(source) is None
+
+
+class RenderCache(object):
+    """
+    A persistent, size-capped LRU map from (template blob, configuration) to rendered blob.
+    """
+
+    path: str
+    max_entries: int
+    hits: int
+    misses: int
+
+    __slots__ = ["path", "max_entries", "hits", "misses", "_db", "_pending"]
+
+    def __init__(self, cache_dir, max_entries=DEFAULT_RENDER_CACHE_ENTRIES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "render.sqlite")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+        self._db = sqlite3.connect(self.path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS render ("
+            "key TEXT PRIMARY KEY, binsha BLOB NOT NULL, atime INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS render_atime ON render (atime)")
+
+    @staticmethod
+    def key(template_binsha: bytes, config_digest):
+        """
+        The cache key of a template blob rendered with a configuration digest
+        """
+        h = hashlib.sha256(template_binsha)
+        for part in (config_digest, __version__, jinja2.__version__):
+            h.update(b"\0" + part.encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key, valid=None):
+        """
+        Return the rendered blob sha for `key`, or None.
+
+        `valid` is an optional predicate on the binsha, e.g. to check it is still in the odb.
+        """
+        if key in self._pending:
+            row = self._pending[key][1:2]
+        else:
+            row = self._db.execute("SELECT binsha FROM render WHERE key = ?", (key,)).fetchone()
+        if row is None or (valid is not None and not valid(row[0])):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._pending[key] = (key, row[0], time.time_ns())
+        return row[0]
+
+    def put(self, key, binsha: bytes):
+        self._pending[key] = (key, binsha, time.time_ns())
+
+    def flush(self):
+        """
+        Write the new entries and access times in a single transaction, then evict
+        the least recently used entries above `max_entries`.
+        """
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO render VALUES (?, ?, ?)", self._pending.values()
+            )
+            self._pending.clear()
+            self._db.execute(
+                "DELETE FROM render WHERE key IN ("
+                "SELECT key FROM render ORDER BY atime DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM render").fetchone()[0]
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, entries=len(self))
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+
+class LRUCache(object):
+    """
+    A thread-safe in-memory map that keeps its `max_entries` most recently used items.
+    """
+
+    max_entries: int
+    hits: int
+    misses: int
+
+    __slots__ = ["max_entries", "hits", "misses", "_items", "_lock"]
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._items[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, entries=len(self))
+
+
+class BytecodeCache(FileSystemBytecodeCache):
+    """
+    A FileSystemBytecodeCache with atomic writes, LRU size limits, and string templates.
+
+    Buckets are keyed by template name and source checksum rather than by file name, so an
+    unchanged template is never compiled twice, even when it is rendered in another repository.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_BYTECODE_CACHE_MB * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(directory)
+        self.max_bytes = max_bytes
+
+    def get_bucket(self, environment, name, filename, source):
+        checksum = self.get_source_checksum(source)
+        bucket = Bucket(environment, self.get_cache_key(name, checksum), checksum)
+        self.load_bytecode(bucket)
+        return bucket
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is not None:
+            # Record the access for the LRU pruning
+            try:
+                os.utime(self._get_cache_filename(bucket))
+            except OSError:
+                pass
+
+    def dump_bytecode(self, bucket):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            bucket.write_bytecode(f)
+        os.replace(tmp_path, self._get_cache_filename(bucket))
+
+    def from_string(self, environment: Environment, source) -> Template:
+        """
+        Like `environment.from_string`, but the compiled code goes through the cache
+        """
+        bucket = self.get_bucket(environment, source, None, source)
+        if bucket.code is None:
+            bucket.code = environment.compile(source)
+            self.set_bucket(bucket)
+        return environment.template_class.from_code(
+            environment, bucket.code, environment.make_globals(None), None
+        )
+
+    def prune(self):
+        """
+        Remove the least recently used bytecode until the cache fits in `max_bytes`
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if fnmatch(entry.name, self.pattern % "*"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+class MemoryBytecodeCache(BytecodeCache):
+    """
+    A BytecodeCache kept in memory, for the long-running render daemon.
+
+    The compiled templates are evicted least recently used first, once they take more than
+    `max_bytes`. It is safe to share between threads.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_BYTECODE_CACHE_MB * 1024 * 1024):
+        # There is no directory to set up, see FileSystemBytecodeCache.__init__
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._code = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def load_bytecode(self, bucket):
+        with self._lock:
+            try:
+                self._code.move_to_end(bucket.key)
+            except KeyError:
+                self.misses += 1
+                return
+            self.hits += 1
+            data = self._code[bucket.key]
+        bucket.bytecode_from_string(data)
+
+    def dump_bytecode(self, bucket):
+        data = bucket.bytecode_to_string()
+        with self._lock:
+            self._size += len(data) - len(self._code.pop(bucket.key, b""))
+            self._code[bucket.key] = data
+            while self._size > self.max_bytes and self._code:
+                self._size -= len(self._code.popitem(last=False)[1])
+
+    def clear(self):
+        with self._lock:
+            self._code.clear()
+            self._size = 0
+
+    def prune(self):
+        pass
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, entries=len(self._code), bytes=self._size)
+
+
+class TemplateMirrors(object):
+    """
+    Bare mirrors of template repositories, keyed by URL and shared between repositories.
+
+    A mirror is only fetched from its remote when it is older than `ttl` seconds, so renders
+    against a warm mirror need no remote traffic.
+    """
+
+    directory: str
+    ttl: float
+    hits: int
+    misses: int
+
+    __slots__ = ["directory", "ttl", "hits", "misses"]
+
+    def __init__(self, directory, ttl=DEFAULT_MIRROR_TTL):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, url):
+        """
+        The local path of the mirror of `url`
+        """
+        return os.path.join(
+            self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".git"
+        )
+
+    def is_fresh(self, url):
+        try:
+            fetched = os.path.getmtime(os.path.join(self.path(url), "gittr-fetched"))
+        except OSError:
+            return False
+        return time.time() - fetched < self.ttl
+
+    def update(self, url):
+        """
+        Clone or fetch the mirror of `url` unless it is fresh, and return its path
+        """
+        path = self.path(url)
+        with locked(path + ".lock"):
+            if self.is_fresh(url):
+                self.hits += 1
+            else:
+                self.misses += 1
+                if os.path.isdir(path):
+                    Git(path).fetch("--prune", "origin")
+                else:
+                    shutil.rmtree(path + ".tmp", ignore_errors=True)
+                    Git().clone("--mirror", url, path + ".tmp")
+                    os.rename(path + ".tmp", path)
+                with open(os.path.join(path, "gittr-fetched"), "w"):
+                    pass
+        return path
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
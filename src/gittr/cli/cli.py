@@ -1,14 +1,24 @@
 """Console script for ght."""
 
 import collections
+import importlib
+import json
 import os
+import shutil
+import sys
+import time
 
 import click
-from click_plugins import with_plugins
-from entrypoints import get_group_named
 
-from gittr.cli.action import GHT
-from gittr.cli.utils import stashed_checkout, resolve_repository_path
+# GitPython, Jinja2 and PyYAML are only imported by the commands that use them, to keep the
+# startup of `gittr --help` and of shell completion fast.
+from gittr.cli.constants import (
+    DEFAULT_BYTECODE_CACHE_MB,
+    DEFAULT_MIRROR_TTL,
+    DEFAULT_RENDER_CACHE_ENTRIES,
+    FETCH_STRATEGIES,
+    ISOLATION_MODES,
+)
 
 
 class OrderedGroup(click.Group):
@@ -24,17 +34,209 @@ class OrderedGroup(click.Group):
         return self.commands
 
 
-@with_plugins(get_group_named("gittr").values())
-@click.group(cls=OrderedGroup)
-def cli():
+def user_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "gittr")
+
+
+def plugin_cache_path():
+    return os.path.join(user_cache_dir(), "plugins.json")
+
+
+def entry_points(group):
+    """
+    The `module:attr` of the entry points in `group`, by name.
+
+    The discovery is cached until an entry of sys.path changes, because importing the
+    `entrypoints` library takes longer than the rest of the startup. The first entry, the
+    directory of the script or the current directory, is left out of the cache key.
+    """
+    key = []
+    for path in sys.path[1:]:
+        try:
+            key.append([path, os.stat(path).st_mtime_ns])
+        except OSError:
+            pass
+
+    cache_path = plugin_cache_path()
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if cache["key"] == key and group in cache["groups"]:
+            return cache["groups"][group]
+    except (OSError, ValueError, KeyError):
+        cache = dict(key=key, groups={})
+    if cache["key"] != key:
+        cache = dict(key=key, groups={})
+
+    from entrypoints import get_group_named
+
+    cache["groups"][group] = {
+        name: f"{ep.module_name}:{ep.object_name}" if ep.object_name else ep.module_name
+        for name, ep in get_group_named(group).items()
+    }
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(f"{cache_path}.{os.getpid()}", "w") as f:
+            json.dump(cache, f)
+        os.replace(f"{cache_path}.{os.getpid()}", cache_path)
+    except OSError:
+        pass
+    return cache["groups"][group]
+
+
+def load_entry_point(reference):
+    """
+    The object at a `module:attr` entry point reference
+    """
+    module_name, _, attrs = reference.partition(":")
+    obj = importlib.import_module(module_name)
+    for attr in filter(None, attrs.split(".")):
+        obj = getattr(obj, attr)
+    return obj
+
+
+class PluginGroup(OrderedGroup):
+    """An OrderedGroup with the commands of the `gittr` entry point group.
+
+    The plugins are discovered when a command is not a built-in one, or when the commands are
+    listed, and a plugin is only imported when it is invoked.
+    """
+
+    def __init__(self, name=None, commands=None, entry_point_group="gittr", **attrs):
+        super(PluginGroup, self).__init__(name, commands, **attrs)
+        self.entry_point_group = entry_point_group
+        self._plugins = None
+
+    def plugins(self):
+        """The plugin entry points, `module:attr` by command name"""
+        if self._plugins is None:
+            self._plugins = entry_points(self.entry_point_group)
+        return self._plugins
+
+    def list_commands(self, ctx):
+        return list(self.commands) + sorted(set(self.plugins()) - set(self.commands))
+
+    def get_command(self, ctx, name):
+        if name not in self.commands and name in self.plugins():
+            try:
+                self.commands[name] = load_entry_point(self.plugins()[name])
+            except Exception:
+                from click_plugins.core import BrokenCommand
+
+                self.commands[name] = BrokenCommand(name)
+        return self.commands.get(name)
+
+    def format_commands(self, ctx, formatter):
+        """Lists the plugins that were not invoked without importing them"""
+        commands = [(name, cmd) for name, cmd in self.commands.items() if not cmd.hidden]
+        plugins = [name for name in self.list_commands(ctx) if name not in self.commands]
+        if not commands and not plugins:
+            return
+
+        limit = formatter.width - 6 - max(len(name) for name in [c for c, _ in commands] + plugins)
+        rows = [(name, cmd.get_short_help_str(limit)) for name, cmd in commands]
+        rows += [(name, f"Plugin from {self.plugins()[name]}.") for name in plugins]
+        with formatter.section("Commands"):
+            formatter.write_dl(rows)
+
+
+def mirror_options(f):
+    """Adds the --mirror-dir and --mirror-ttl options to a command"""
+    f = click.option(
+        "--mirror-ttl",
+        envvar="GITTR_MIRROR_TTL",
+        default=DEFAULT_MIRROR_TTL,
+        type=click.FloatRange(min=0),
+        help="Seconds before a template mirror is fetched again. "
+        f"[default: {DEFAULT_MIRROR_TTL}, env: GITTR_MIRROR_TTL]",
+    )(f)
+    f = click.option(
+        "--mirror-dir",
+        envvar="GITTR_MIRROR_DIR",
+        default=None,
+        type=click.Path(file_okay=False),
+        help="Fetch templates through local mirrors kept in this directory. "
+        "[env: GITTR_MIRROR_DIR]",
+    )(f)
+    return f
+
+
+fetch_option = click.option(
+    "--fetch",
+    "fetch_strategy",
+    type=click.Choice(FETCH_STRATEGIES),
+    default="auto",
+    help="How much of the template to transfer: the full history, the tip commit (shallow), "
+    "or only .github/ght.yaml (config). [default: auto, from ght.template.fetch or the command]",
+)
+
+
+socket_option = click.option(
+    "--socket",
+    "socket_path",
+    envvar="GITTR_SOCKET",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="The Unix socket of the render daemon. "
+    "[default: $XDG_RUNTIME_DIR/gittr.sock, env: GITTR_SOCKET]",
+)
+
+
+isolation_option = click.option(
+    "--isolation",
+    envvar="GITTR_ISOLATION",
+    type=click.Choice(ISOLATION_MODES),
+    default="worktree",
+    help="Work on the ght branches in a temporary git worktree, leaving the working tree alone, "
+    "or stash it and check them out in place. The default used to be stash; pass "
+    "--isolation stash for the previous behaviour. [default: worktree, env: GITTR_ISOLATION]",
+)
+
+
+force_option = click.option(
+    "--force",
+    "-f",
+    is_flag=True,
+    default=False,
+    help="Render even when the branch is already a render of the current template commits "
+    "and configuration.",
+)
+
+
+def template_mirrors(mirror_dir, mirror_ttl):
+    from gittr.cli.cache import TemplateMirrors
+
+    return TemplateMirrors(mirror_dir, ttl=mirror_ttl) if mirror_dir else None
+
+
+@click.group(cls=PluginGroup)
+@click.option(
+    "--trace",
+    "trace_path",
+    envvar="GITTR_TRACE",
+    default=None,
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the timing of each phase and git subprocess to this file, in the Chrome trace "
+    "format (chrome://tracing, ui.perfetto.dev). [env: GITTR_TRACE]",
+)
+@click.pass_context
+def cli(ctx, trace_path):
     """gittr command-line-interface"""
+    if trace_path is not None:
+        from gittr.cli import trace
+
+        trace.start(trace_path, name=" ".join(["gittr"] + sys.argv[1:]))
+        ctx.call_on_close(trace.stop)
     return 0
 
 
 @cli.command("init")
 @click.argument("repository", type=str)
 @click.argument("refspec", type=str, default="master", metavar="[REFSPEC]")
-def init(repository, refspec):
+@mirror_options
+@fetch_option
+def init(repository, refspec, mirror_dir, mirror_ttl, fetch_strategy):
     """Initialize a git project from a ght-template repository.
 
     \b
@@ -53,44 +255,158 @@ def init(repository, refspec):
         $ cd example
         $ ght init https://github.com/sodre/ght-pypackage master
     """
+    from gittr.cli.action import GHT
 
     if len(os.listdir(".")) > 0:
         raise click.ClickException("The current directory is not empty, refusing to initialize it.")
 
     # Setup the GHT Repository
-    _ = GHT.init(path=".", template_url=repository, template_ref=refspec)
+    _ = GHT.init(
+        path=".",
+        template_url=repository,
+        template_ref=refspec,
+        mirrors=template_mirrors(mirror_dir, mirror_ttl),
+        fetch_strategy=fetch_strategy,
+    )
 
     return 0
 
 
 @cli.command("configure")
 @click.argument("repo-path", default=".", type=click.Path(file_okay=False, exists=True))
-def configure(repo_path):
+@isolation_option
+def configure(repo_path, isolation):
     """Edit an existing template configuration file
 
     A git commit is created if the file is modified.
     """
+    from gittr.cli.action import GHT
+    from gittr.cli.utils import resolve_repository_path
 
     # Open the repo
     repo_path = resolve_repository_path(repo_path)
-    ght = GHT(repo_path, None)
+    ght = GHT(repo_path, None, isolation=isolation)
 
-    with stashed_checkout(ght.repo, "ght/master"):
-        click.edit(filename=f"{repo_path}/.github/ght.yaml")
-        ght.repo.index.add(".github/ght.yaml")
-        ght.repo.index.commit("[ght]: Update configuration file.", skip_hooks=True)
+    with ght.checkout("ght/master", paths=[".github/ght.yaml"]) as repo:
+        click.edit(filename=ght.config_path)
+        repo.index.add(".github/ght.yaml")
+        repo.index.commit("[ght]: Update configuration file.", skip_hooks=True)
 
 
 @cli.command()
 @click.option("-url", "-u", default=None, help="The upstream template url. [default: from config]")
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes used to render the content. [default: 1]",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(["checkout", "odb"]),
+    default="checkout",
+    help="Render in a checkout of GHT_BRANCH, or straight into the object database. "
+    "[default: checkout]",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=False,
+    help="Reuse rendered blobs from previous renders. [default: no-cache]",
+)
+@click.option(
+    "--cache-size",
+    default=DEFAULT_RENDER_CACHE_ENTRIES,
+    type=click.IntRange(min=0),
+    help=f"Maximum number of rendered blobs to remember. [default: {DEFAULT_RENDER_CACHE_ENTRIES}]",
+)
+@click.option(
+    "--bytecode-cache/--no-bytecode-cache",
+    default=True,
+    help="Reuse the compiled templates from previous renders. [default: bytecode-cache]",
+)
+@click.option(
+    "--bytecode-cache-size",
+    default=DEFAULT_BYTECODE_CACHE_MB,
+    type=click.IntRange(min=0),
+    help="Maximum size of the compiled template cache in MB. "
+    f"[default: {DEFAULT_BYTECODE_CACHE_MB}]",
+)
+@click.option(
+    "--output-tar",
+    type=click.File("wb"),
+    default=None,
+    help="Stream the rendered files to this tar file, - for stdout, instead of committing them.",
+)
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Write the rendered files to this directory instead of committing them.",
+)
+@click.option(
+    "--watch",
+    "watch_dir",
+    type=click.Path(file_okay=False, exists=True),
+    default=None,
+    help="Render this local template working copy, and render it again as it changes.",
+)
+@click.option(
+    "--daemon",
+    is_flag=True,
+    default=False,
+    help="Send the render to the `gittr serve` daemon, with its warm caches.",
+)
+@socket_option
+@mirror_options
+@fetch_option
+@isolation_option
+@force_option
 @click.argument("refspec", default="master", metavar="[REFSPEC]")
 @click.argument("dest-branch", default="ght/master", metavar="[GHT_BRANCH]")
-def render(url, refspec, dest_branch):
+def render(
+    url,
+    jobs,
+    backend,
+    cache,
+    cache_size,
+    bytecode_cache,
+    bytecode_cache_size,
+    output_tar,
+    output_dir,
+    watch_dir,
+    daemon,
+    socket_path,
+    mirror_dir,
+    mirror_ttl,
+    fetch_strategy,
+    isolation,
+    force,
+    refspec,
+    dest_branch,
+):
     """Render the template.
 
     \b
     REFSPEC: The template branch/refspec to use for rendering [default=master]
     GHT_BRANCH: The destination branch of the rendered results [default=ght/master]
+
+    \b
+    The odb backend never touches the working tree, which makes it a good fit for CI renders.
+    With --output-tar or --output-dir, GHT_BRANCH only provides the configuration: nothing is
+    committed, and the index and working tree are left alone.
+
+    \b
+    With --watch, the template is read from a local working copy instead of being fetched, and
+    only the files that change are rendered again, into --output-dir or onto GHT_BRANCH.
+
+    \b
+    With --daemon, the render runs in the `gittr serve` daemon, with the daemon's mirrors and
+    compiled templates.
+
+    \b
+    The render commits record the template commits, the configuration and the gittr version
+    as trailers. When none of them changed, nothing is fetched nor rendered, unless --force.
     """
     if not dest_branch.startswith("ght/"):
         raise click.ClickException(
@@ -98,29 +414,405 @@ def render(url, refspec, dest_branch):
             f"The destination branch `{dest_branch}` does not begin ght/."
         )
 
+    if daemon:
+        if output_tar is not None or output_dir is not None or watch_dir is not None:
+            raise click.UsageError("--daemon cannot be used with --output-* or --watch.")
+        return render_with_daemon(
+            socket_path,
+            dict(
+                command="render",
+                repo_path=os.getcwd(),
+                template_url=url,
+                template_ref=refspec,
+                dest_branch=dest_branch,
+                backend=backend,
+                fetch_strategy=fetch_strategy,
+                isolation=isolation,
+                cache=cache,
+                cache_size=cache_size,
+                force=force,
+            ),
+        )
+
+    from gittr.cli.action import GHT
+    from gittr.cli.cache import BytecodeCache, RenderCache, default_cache_dir
+    from gittr.cli.utils import resolve_repository_path
+
     repo_path = resolve_repository_path(".")
-    ght = GHT(repo_path=repo_path, template_url=url, template_ref=refspec)
+    ght = GHT(
+        repo_path=repo_path,
+        template_url=url,
+        template_ref=refspec,
+        jobs=jobs,
+        mirrors=template_mirrors(mirror_dir, mirror_ttl),
+        fetch_strategy=fetch_strategy,
+        isolation=isolation,
+    )
     ght.load_config()
 
-    if ght.template_url is None:
+    if ght.template_url is None and watch_dir is None:
         raise click.ClickException(
             "Could not detect the template repository url. " "Please set it manually with -u/--url"
         )
 
-    with stashed_checkout(ght.repo, dest_branch):
-        ght.render_tree()
+    output = output_tar is not None or output_dir is not None
+    if output_tar is not None and output_dir is not None:
+        raise click.UsageError("--output-tar and --output-dir are mutually exclusive.")
+    if output and cache:
+        raise click.UsageError("The render cache stores blobs, it cannot be used with --output-*.")
+    if watch_dir is not None and (output_tar is not None or cache):
+        raise click.UsageError("--watch cannot be used with --output-tar or --cache.")
+
+    if cache:
+        ght.cache = RenderCache(default_cache_dir(ght.repo), max_entries=cache_size)
+    if bytecode_cache:
+        ght.env.bytecode_cache = BytecodeCache(
+            os.path.join(default_cache_dir(ght.repo), "bytecode"),
+            max_bytes=bytecode_cache_size * 1024 * 1024,
+        )
 
+    try:
+        if watch_dir is not None:
+            watch_template(ght, watch_dir, output_dir, dest_branch)
+            return 0
+        if output_tar is not None:
+            ght.render_tar(output_tar, dest_branch)
+        elif output_dir is not None:
+            ght.render_dir(output_dir, dest_branch)
+        elif not ght.render(dest_branch, backend, force=force):
+            click.echo(f"{dest_branch} is up to date, nothing to render. Use --force to render.")
+            return 0
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        if ght.cache is not None:
+            ght.cache.close()
+            click.echo(f"Render cache: {ght.cache.hits} hits, {ght.cache.misses} misses")
+        if ght.env.bytecode_cache is not None:
+            ght.env.bytecode_cache.prune()
+
+    click.echo(
+        f"Rendered {ght.stats['rendered']} files "
+        f"({ght.stats['cached']} from the render cache), "
+        f"copied {ght.stats['copied']} files unchanged.",
+        err=output,
+    )
+    return 0
+
+
+def render_with_daemon(socket_path, request):
+    """
+    Send the render `request` to the daemon, and report its outcome like `render` does
+    """
+    from gittr.cli.client import default_socket_path, send_request
+
+    try:
+        response = send_request(socket_path or default_socket_path(), request)
+    except ConnectionError as e:
+        raise click.ClickException(f"{e} Start it with `gittr serve`.")
+    if not response["ok"]:
+        raise click.ClickException(response["error"])
+    if response.get("skipped"):
+        click.echo(
+            f"{request['dest_branch']} is up to date, nothing to render. Use --force to render."
+        )
+        return 0
+    stats = response["stats"]
+    click.echo(
+        f"Rendered {stats.get('rendered', 0)} files "
+        f"({stats.get('cached', 0)} from the render cache), "
+        f"copied {stats.get('copied', 0)} files unchanged, "
+        f"in {response['seconds']:.2f}s by the daemon."
+    )
+    return 0
+
+
+def watch_template(ght, template_dir, output_dir, dest_branch):
+    """
+    Render the template working copy at `template_dir`, and then each of its changes, until
+    interrupted. Template errors are reported without stopping the watch.
+    """
+    from jinja2 import TemplateError
+    from gittr.cli.watch import BranchOutput, DirectoryOutput, IncrementalRenderer, watch_changes
+
+    if output_dir is not None:
+        output = DirectoryOutput(output_dir)
+    else:
+        output = BranchOutput(ght, dest_branch)
+    renderer = IncrementalRenderer(ght, template_dir, output, dest_branch)
+
+    start = time.perf_counter()
+    paths = renderer.render_all()
+    click.echo(
+        f"Rendered {len(paths)} files in {(time.perf_counter() - start) * 1000:.0f} ms, "
+        f"watching {template_dir} for changes."
+    )
+    try:
+        for changes in watch_changes(template_dir):
+            start = time.perf_counter()
+            try:
+                paths = renderer.update(changes)
+            except (TemplateError, ValueError, OSError) as e:
+                click.echo(f"Error: {e}", err=True)
+                continue
+            if not paths:
+                continue
+            for path in paths:
+                click.echo(f"  {path}")
+            click.echo(
+                f"Updated {len(paths)} files in {(time.perf_counter() - start) * 1000:.1f} ms"
+            )
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command("render-many")
+@click.argument("patterns", nargs=-1, metavar="[REPO_GLOB]...")
+@click.option(
+    "--manifest",
+    "-m",
+    type=click.Path(dir_okay=False, exists=True),
+    default=None,
+    help="A file listing one repository path or glob per line.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    default=os.cpu_count() or 1,
+    type=click.IntRange(min=1),
+    help="Number of repositories rendered at the same time. [default: number of CPUs]",
+)
+@click.option(
+    "--ref",
+    "refspec",
+    default="master",
+    help="The template branch/refspec to use for rendering. [default: master]",
+)
+@click.option(
+    "--branch",
+    "dest_branch",
+    default="ght/master",
+    help="The destination branch of the rendered results. [default: ght/master]",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(["checkout", "odb"]),
+    default="checkout",
+    help="Render in a checkout of the branch, or straight into the object database. "
+    "[default: checkout]",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=False,
+    help="Reuse rendered blobs from previous renders. [default: no-cache]",
+)
+@click.option(
+    "--bytecode-cache-dir",
+    envvar="GITTR_BYTECODE_CACHE_DIR",
+    default=None,
+    type=click.Path(file_okay=False),
+    help="Share the compiled templates through this directory. "
+    "[default: a temporary directory, env: GITTR_BYTECODE_CACHE_DIR]",
+)
+@mirror_options
+@fetch_option
+@isolation_option
+@force_option
+def render_many(
+    patterns,
+    manifest,
+    jobs,
+    refspec,
+    dest_branch,
+    backend,
+    cache,
+    bytecode_cache_dir,
+    mirror_dir,
+    mirror_ttl,
+    fetch_strategy,
+    isolation,
+    force,
+):
+    """Render the template of many repositories.
+
+    \b
+    REPO_GLOB: Paths, or globs, of the GHT repositories to render.
+
+    \b
+    Each template is fetched once and its templates compiled once, however many repositories
+    use it. A failed repository does not stop the others; the command fails at the end.
+
+    \b
+    EXAMPLES:
+        $ gittr render-many -j 8 ~/src/*
+        $ gittr render-many --manifest repos.txt --backend odb
+    """
+    from gittr.cli.batch import render_repositories, repository_paths
+
+    if not dest_branch.startswith("ght/"):
+        raise click.ClickException(
+            "Refusing to render the template."
+            f"The destination branch `{dest_branch}` does not begin ght/."
+        )
+
+    repo_paths = repository_paths(patterns, manifest)
+    if not repo_paths:
+        raise click.ClickException("No repositories to render, pass a REPO_GLOB or --manifest.")
+
+    start = time.perf_counter()
+    failed = []
+    results = render_repositories(
+        repo_paths,
+        jobs=jobs,
+        mirrors=template_mirrors(mirror_dir, mirror_ttl),
+        bytecode_dir=bytecode_cache_dir,
+        template_ref=refspec,
+        dest_branch=dest_branch,
+        backend=backend,
+        fetch_strategy=fetch_strategy,
+        isolation=isolation,
+        cache=cache,
+        force=force,
+    )
+    for result in results:
+        if result.ok and result.skipped:
+            click.echo(f"ok      {result.seconds:7.2f}s  {result.path} (up to date)")
+        elif result.ok:
+            click.echo(
+                f"ok      {result.seconds:7.2f}s  {result.path} "
+                f"(rendered {result.stats.get('rendered', 0)}, "
+                f"cached {result.stats.get('cached', 0)}, "
+                f"copied {result.stats.get('copied', 0)})"
+            )
+        else:
+            failed.append(result)
+            click.echo(f"FAILED  {result.seconds:7.2f}s  {result.path}: {result.error}")
+
+    click.echo(
+        f"Rendered {len(repo_paths) - len(failed)} of {len(repo_paths)} repositories "
+        f"in {time.perf_counter() - start:.2f}s."
+    )
+    if failed:
+        raise click.ClickException(f"{len(failed)} repositories failed to render.")
     return 0
 
 
 @cli.command("approve")
 @click.argument("commit", default="ght/master")
-def approve(commit):
+@isolation_option
+def approve(commit, isolation):
     """Merge the rendered template from ght/master to master
+
+    The merge is computed in memory and master is advanced without being checked out, with
+    git 2.38 or later; with --isolation stash, master is checked out in place and merged with
+    `git merge` instead.
     """
+    from gittr.cli.action import GHT
+    from gittr.cli.utils import resolve_repository_path
+
+    repo_path = resolve_repository_path(".")
+    ght = GHT(repo_path=repo_path, isolation=isolation)
+
+    head = ght.repo.head
+    if isolation == "worktree" and ght.repo.git.version_info >= (2, 38):
+        # git merge-tree --write-tree is new in git 2.38
+        try:
+            merge = ght.merge(commit, "master")
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        if merge is None:
+            click.echo("Already up to date.")
+        else:
+            click.echo(f"[master {merge.hexsha[:7]}] {merge.summary}")
+        return
+    if isolation == "worktree" and not head.is_detached and head.ref.name == "master":
+        # git merge refuses to overwrite local changes, so there is nothing to stash
+        click.echo(ght.repo.git.merge("--no-squash", "--no-ff", commit))
+        return
+
+    with ght.checkout("master") as repo:
+        click.echo(repo.git.merge("--no-squash", "--no-ff", commit))
+
+
+@cli.command("serve")
+@socket_option
+@click.option(
+    "--max-requests",
+    default=os.cpu_count() or 1,
+    type=click.IntRange(min=1),
+    help="Number of renders run at the same time, the others wait. [default: number of CPUs]",
+)
+@click.option(
+    "--bytecode-cache-size",
+    default=DEFAULT_BYTECODE_CACHE_MB,
+    type=click.IntRange(min=0),
+    help="Maximum size of the compiled templates kept in memory in MB. "
+    f"[default: {DEFAULT_BYTECODE_CACHE_MB}]",
+)
+@mirror_options
+@click.option("--stats", is_flag=True, default=False, help="Print the stats of the daemon.")
+@click.option("--stop", is_flag=True, default=False, help="Stop the daemon.")
+def serve(socket_path, max_requests, bytecode_cache_size, mirror_dir, mirror_ttl, stats, stop):
+    """Serve renders from a daemon with warm caches
+
+    The daemon listens on a Unix socket for `gittr render --daemon`, and keeps the template
+    mirrors, the parsed configurations and the compiled templates between renders. It stops
+    on SIGTERM or SIGINT after the renders in flight.
+    """
+    from gittr.cli.client import default_socket_path, send_request
+
+    socket_path = socket_path or default_socket_path()
+    if stats or stop:
+        try:
+            response = send_request(socket_path, dict(command="stats" if stats else "shutdown"))
+        except ConnectionError as e:
+            raise click.ClickException(str(e))
+        click.echo(json.dumps(response["stats"], indent=2) if stats else "Stopping the daemon.")
+        return 0
+
+    import signal
+    import threading
+    from gittr.cli.daemon import RenderServer
+
+    if mirror_dir is None:
+        mirror_dir = os.path.join(user_cache_dir(), "mirrors")
+    try:
+        server = RenderServer(
+            socket_path,
+            mirror_dir,
+            max_requests=max_requests,
+            mirror_ttl=mirror_ttl,
+            bytecode_cache_size=bytecode_cache_size,
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    click.echo(f"Serving renders on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        click.echo("Waiting for the renders in flight.")
+        server.server_close()
+    return 0
+
+
+@cli.group("cache", cls=OrderedGroup)
+def cache_group():
+    """Manage the rendered blob and compiled template caches"""
+    return 0
+
+
+@cache_group.command("clear")
+def cache_clear():
+    """Remove every cached rendered blob and compiled template"""
+    from gittr.cli.action import GHT
+    from gittr.cli.cache import default_cache_dir
+    from gittr.cli.utils import resolve_repository_path
 
     repo_path = resolve_repository_path(".")
     ght = GHT(repo_path=repo_path)
 
-    with stashed_checkout(ght.repo, "master"):
-        click.echo(ght.repo.git.merge("--no-squash", "--no-ff", commit))
+    shutil.rmtree(default_cache_dir(ght.repo), ignore_errors=True)
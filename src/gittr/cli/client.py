@@ -0,0 +1,41 @@
+"""The client side of the gittr render daemon, see gittr.cli.daemon.
+
+Each request is one JSON object on one line, answered by one JSON object on one line. This
+module only needs the standard library, so that `gittr render --daemon` starts quickly.
+"""
+
+import json
+import os
+import socket
+
+
+def default_socket_path():
+    """
+    The socket of the render daemon, $GITTR_SOCKET or $XDG_RUNTIME_DIR/gittr.sock
+    """
+    if "GITTR_SOCKET" in os.environ:
+        return os.environ["GITTR_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "gittr"
+    )
+    return os.path.join(runtime_dir, "gittr.sock")
+
+
+def send_request(socket_path, request: dict, timeout=None) -> dict:
+    """
+    Send `request` to the daemon listening on `socket_path`, and return its response.
+
+    Raises ConnectionError when no daemon is listening.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        try:
+            s.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise ConnectionError(f"No gittr daemon is listening on {socket_path}: {e}")
+        s.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with s.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f"The gittr daemon on {socket_path} closed the connection.")
+    return json.loads(line)
@@ -0,0 +1,15 @@
+"""Defaults and choices shared by the command line and the library.
+
+This module is imported by the command line before any subcommand runs, so it must not import
+GitPython, Jinja2 or PyYAML.
+"""
+
+DEFAULT_RENDER_CACHE_ENTRIES = 100_000
+DEFAULT_BYTECODE_CACHE_MB = 256
+DEFAULT_MIRROR_TTL = 300
+
+# full: the whole history, shallow: only the tip commit, config: only .github/ght.yaml
+FETCH_STRATEGIES = ("auto", "full", "shallow", "config")
+
+# worktree: work on ght branches in a temporary worktree, stash: stash and check out in place
+ISOLATION_MODES = ("worktree", "stash")
@@ -0,0 +1,187 @@
+"""A long-running render daemon, listening on a Unix socket.
+
+The daemon keeps what every `gittr render` otherwise rebuilds from zero: the imports, the
+template mirrors, the parsed configurations and the compiled templates. The requests are the
+JSON lines of gittr.cli.client:
+
+    {"command": "render", "repo_path": "/src/repo", "dest_branch": "ght/master", ...}
+    {"command": "stats"}
+    {"command": "shutdown"}
+"""
+
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import Counter, defaultdict
+
+import click
+
+from gittr.cli.batch import render_repository
+from gittr.cli.cache import LRUCache, MemoryBytecodeCache, TemplateMirrors
+from gittr.cli.constants import DEFAULT_BYTECODE_CACHE_MB, DEFAULT_MIRROR_TTL
+from gittr.cli.utils import resolve_repository_path
+
+DEFAULT_CONFIG_ENTRIES = 1024
+
+# The render options a client may set, see `render_repository`
+RENDER_OPTIONS = (
+    "template_url",
+    "template_ref",
+    "dest_branch",
+    "backend",
+    "fetch_strategy",
+    "isolation",
+    "cache",
+    "cache_size",
+    "force",
+)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    server: "RenderServer"
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            command = request.get("command")
+        except (ValueError, AttributeError):
+            command, request = None, {}
+
+        if command == "render":
+            response = self.server.render(request)
+        elif command == "stats":
+            response = dict(ok=True, stats=self.server.stats())
+        elif command == "shutdown":
+            # shutdown() waits for serve_forever, which waits for this request to return
+            threading.Thread(target=self.server.shutdown).start()
+            response = dict(ok=True)
+        else:
+            response = dict(ok=False, error=f"Unknown request: {command}")
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class RenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves render requests on the Unix socket at `socket_path`, with up to `max_requests`
+    renders at a time; the others wait for their turn. Renders of the same repository are
+    run one after the other.
+
+    Closing the server waits for the requests in flight.
+    """
+
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(
+        self,
+        socket_path,
+        mirror_dir,
+        max_requests=os.cpu_count() or 1,
+        mirror_ttl=DEFAULT_MIRROR_TTL,
+        config_entries=DEFAULT_CONFIG_ENTRIES,
+        bytecode_cache_size=DEFAULT_BYTECODE_CACHE_MB,
+    ):
+        self.mirrors = TemplateMirrors(mirror_dir, ttl=mirror_ttl)
+        self.parsed_configs = LRUCache(config_entries)
+        self.bytecode_cache = MemoryBytecodeCache(max_bytes=bytecode_cache_size * 1024 * 1024)
+        self.max_requests = max_requests
+        self.counts = Counter()
+        self.started = time.time()
+        self._slots = threading.BoundedSemaphore(max_requests)
+        self._repo_locks = defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+
+        remove_stale_socket(socket_path)
+        os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+        super().__init__(socket_path, RequestHandler)
+        os.chmod(socket_path, 0o600)
+
+    def render(self, request):
+        options = {k: v for k, v in request.items() if k in RENDER_OPTIONS}
+        try:
+            repo_path = resolve_repository_path(os.path.realpath(request["repo_path"]))
+        except (KeyError, click.UsageError) as e:
+            self.count(failed=1)
+            return dict(ok=False, error=f"Invalid repo_path: {e}")
+        self.count(waiting=1)
+        with self._slots:
+            self.count(waiting=-1, running=1)
+            with self._lock:
+                repo_lock = self._repo_locks[repo_path]
+            try:
+                with repo_lock:
+                    result = render_repository(
+                        repo_path,
+                        mirrors=self.mirrors,
+                        bytecode_cache=self.bytecode_cache,
+                        parsed_configs=self.parsed_configs,
+                        **options,
+                    )
+            finally:
+                self.count(running=-1)
+        self.count(rendered=1 if result.ok else 0, failed=0 if result.ok else 1)
+        return dict(
+            ok=result.ok,
+            seconds=result.seconds,
+            stats=result.stats,
+            error=result.error,
+            skipped=result.skipped,
+        )
+
+    def count(self, **deltas):
+        with self._lock:
+            self.counts.update(deltas)
+
+    def stats(self):
+        """
+        The request counts, and the hit rates of the caches
+        """
+
+        def with_hit_rate(stats):
+            lookups = stats["hits"] + stats["misses"]
+            return dict(stats, hit_rate=stats["hits"] / lookups if lookups else None)
+
+        with self._lock:
+            counts = dict(self.counts)
+        return dict(
+            uptime=time.time() - self.started,
+            max_requests=self.max_requests,
+            requests=dict(
+                running=counts.get("running", 0),
+                waiting=counts.get("waiting", 0),
+                rendered=counts.get("rendered", 0),
+                failed=counts.get("failed", 0),
+            ),
+            caches=dict(
+                configs=with_hit_rate(self.parsed_configs.stats()),
+                bytecode=with_hit_rate(self.bytecode_cache.stats()),
+                mirrors=with_hit_rate(self.mirrors.stats()),
+            ),
+        )
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+def remove_stale_socket(socket_path):
+    """
+    Remove the socket at `socket_path` left by a daemon that is gone.
+
+    Raises ValueError when a daemon is still listening on it.
+    """
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(socket_path)
+        except OSError:
+            os.remove(socket_path)
+            return
+    raise ValueError(f"A gittr daemon is already listening on {socket_path}.")
@@ -0,0 +1,169 @@
+"""Timing spans of the gittr phases and git subprocesses, in the Chrome trace format.
+
+The trace is a JSON file that chrome://tracing and https://ui.perfetto.dev open as a timeline.
+Tracing is off unless `start` is called, and then `span`, `traced` and `counter` are no-ops.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from git import Git, IndexFile
+
+_tracer = None
+
+
+class Tracer(object):
+    """
+    Collects the trace events of one gittr command
+    """
+
+    path: str
+    name: str
+    events: list
+    counters: dict
+
+    __slots__ = ["path", "name", "events", "counters", "_start", "_pid"]
+
+    def __init__(self, path, name="gittr"):
+        self.path = path
+        self.name = name
+        self.events = []
+        self.counters = {}
+        self._pid = os.getpid()
+        self._start = self.now()
+
+    @staticmethod
+    def now():
+        """The current time in microseconds"""
+        return time.perf_counter_ns() // 1000
+
+    def complete(self, name, cat, start, args):
+        """Record a span that began at `start` and ends now"""
+        self.events.append(
+            dict(
+                name=name,
+                cat=cat,
+                ph="X",
+                ts=start,
+                dur=self.now() - start,
+                pid=self._pid,
+                tid=threading.get_ident(),
+                args=args,
+            )
+        )
+
+    def counter(self, name, **values):
+        """Record the current `values` of the counter `name`"""
+        self.counters[name] = values
+        self.events.append(
+            dict(name=name, ph="C", ts=self.now(), pid=self._pid, tid=0, args=values)
+        )
+
+    def save(self):
+        """Close the root span and write the trace to `path`"""
+        self.complete(self.name, "gittr", self._start, {})
+        with open(self.path, "w") as f:
+            json.dump(
+                dict(
+                    traceEvents=self.events,
+                    displayTimeUnit="ms",
+                    otherData=dict(counters=self.counters),
+                ),
+                f,
+            )
+
+
+def start(path, name="gittr"):
+    """
+    Trace everything until `stop` into the file at `path`
+    """
+    global _tracer
+    _tracer = Tracer(path, name)
+    Git.execute = _traced_execute
+    IndexFile.write = _traced_index_write
+    return _tracer
+
+
+def stop():
+    """
+    Write the trace started by `start`
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    Git.execute = _git_execute
+    IndexFile.write = _index_write
+    if tracer is not None:
+        tracer.save()
+
+
+@contextmanager
+def span(name, cat="gittr", **args):
+    """
+    A span named `name` around the body of the context
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+    begin = tracer.now()
+    try:
+        yield
+    finally:
+        tracer.complete(name, cat, begin, args)
+
+
+def traced(f):
+    """
+    Wraps the calls to `f` in a span named after it
+    """
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        with span(f.__qualname__):
+            return f(*args, **kwargs)
+
+    return wrapper
+
+
+def counter(name, **values):
+    """
+    Record the current `values` of the counter `name`
+    """
+    if _tracer is not None:
+        _tracer.counter(name, **values)
+
+
+def git_subcommand(argv):
+    """
+    The git subcommand of `argv`, e.g. fetch for `git -c a=b fetch origin`
+    """
+    args = iter(argv[1:])
+    for arg in args:
+        if arg in ("-c", "-C"):
+            next(args, None)
+        elif not arg.startswith("-"):
+            return arg
+    return ""
+
+
+_git_execute = Git.execute
+_index_write = IndexFile.write
+
+
+def _traced_execute(self, command, *args, **kwargs):
+    argv = [str(arg) for arg in command] if isinstance(command, (list, tuple)) else [command]
+    with span(f"git {git_subcommand(argv)}", cat="git", argv=argv):
+        return _git_execute(self, command, *args, **kwargs)
+
+
+def _traced_index_write(self, *args, **kwargs):
+    with span("IndexFile.write", cat="git", path=self.path):
+        result = _index_write(self, *args, **kwargs)
+    if _tracer is not None:
+        writes = _tracer.counters.get("index", {}).get("writes", 0)
+        _tracer.counter("index", writes=writes + 1)
+    return result
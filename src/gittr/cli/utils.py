@@ -1,22 +1,126 @@
 import os
 
 from contextlib import contextmanager
-from itertools import zip_longest
+from itertools import islice
+from tempfile import TemporaryDirectory
 
 import click
-from jinja2 import FileSystemLoader, TemplateNotFound
+from git import Repo
+from jinja2 import BaseLoader, FileSystemLoader, TemplateNotFound, nodes
+from jinja2.loaders import split_template_path
 
+TEMPLATE_DELIMITERS = ("{{", "{%", "{#")
+BINARY_SCAN_BYTES = 8000
 
-def iterable_converged(left, right):
+
+def batched(iterable, size):
+    """
+    Split `iterable` into lists of up to `size` items, without consuming it ahead
     """
-    Returns (True, None) if the two iterables generate identical,
-    otherwise returns (False, index) where index indicates the first position where
-    the iterables differ.
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def has_template_delimiters(source):
+    """
+    True if `source` contains a Jinja2 variable, block or comment delimiter
+    """
+    return any(delimiter in source for delimiter in TEMPLATE_DELIMITERS)
+
+
+def is_template(stream, chunk_size=64 * 1024):
+    """
+    True if the binary file-like `stream` holds text with Jinja2 delimiters.
+
+    Like git, a NUL byte in the first 8000 bytes marks the content as binary. The stream is
+    read in chunks, and only until the answer is known.
+    """
+    delimiters = [delimiter.encode("ascii") for delimiter in TEMPLATE_DELIMITERS]
+    chunk = stream.read(BINARY_SCAN_BYTES)
+    if b"\0" in chunk:
+        return False
+    tail = b""
+    while chunk:
+        data = tail + chunk
+        if any(delimiter in data for delimiter in delimiters):
+            return True
+        tail = data[-1:]
+        chunk = stream.read(chunk_size)
+    return False
+
+
+def templated_values(data, path=()):
+    """
+    Yields (path, source) for every template string in nested dictionaries and lists.
+    """
+    if isinstance(data, dict):
+        items = data.items()
+    elif isinstance(data, list):
+        items = enumerate(data)
+    else:
+        if isinstance(data, str) and has_template_delimiters(data):
+            yield path, data
+        return
+    for key, value in items:
+        yield from templated_values(value, path + (key,))
+
+
+def referenced_paths(node: nodes.Node):
+    """
+    Yields the variable paths a Jinja2 AST reads, e.g. ("ght", "a") for `{{ ght.a }}`.
+    """
+    path = _attribute_path(node)
+    if path is not None:
+        yield path
+        return
+    for child in node.iter_child_nodes():
+        yield from referenced_paths(child)
+
+
+def _attribute_path(node: nodes.Node):
+    if isinstance(node, nodes.Name):
+        return (node.name,) if node.ctx == "load" else None
+    if isinstance(node, nodes.Getattr):
+        path = _attribute_path(node.node)
+        return path and path + (node.attr,)
+    if isinstance(node, nodes.Getitem) and isinstance(node.arg, nodes.Const):
+        path = _attribute_path(node.node)
+        return path and path + (node.arg.value,)
+    return None
+
+
+def toposort(dependencies: dict, name=str):
+    """
+    Returns the keys of `dependencies` ordered so each key comes after the keys it depends on.
+
+    Raises a ValueError naming the cycle if the dependencies are circular.
     """
-    for i, (l_item, r_item) in enumerate(zip_longest(left, right)):
-        if l_item != r_item:
-            return False, i
-    return True, None
+    order, done = [], set()
+    for root in dependencies:
+        if root in done:
+            continue
+        path, on_path, stack = [root], {root}, [iter(dependencies[root])]
+        while stack:
+            for dep in stack[-1]:
+                if dep in done:
+                    continue
+                if dep in on_path:
+                    cycle = path[path.index(dep) :] + [dep]  # noqa: E203
+                    raise ValueError(f"Circular reference: {' -> '.join(map(name, cycle))}")
+                path.append(dep)
+                on_path.add(dep)
+                stack.append(iter(dependencies[dep]))
+                break
+            else:
+                stack.pop()
+                node = path.pop()
+                on_path.discard(node)
+                done.add(node)
+                order.append(node)
+    return order
 
 
 class RestrictedFileSystemLoader(FileSystemLoader):
@@ -52,11 +156,46 @@ class RestrictedFileSystemLoader(FileSystemLoader):
             raise TemplateNotFound(f"The .git folder is not a valid path for templates: {template}")
 
 
+class RestrictedTreeLoader(BaseLoader):
+    """
+    Loads templates from the blobs of a git Tree, with the RestrictedFileSystemLoader rules.
+    """
+
+    def __init__(self, tree, encoding="utf-8"):
+        self.tree = tree
+        self.encoding = encoding
+
+    def get_source(self, environment, template):
+        RestrictedFileSystemLoader._ensure_not_unsafe_github(template)
+        RestrictedFileSystemLoader._ensure_not_git(template)
+
+        try:
+            blob = self.tree / "/".join(split_template_path(template))
+        except KeyError:
+            raise TemplateNotFound(template)
+        if blob.type != "blob":
+            raise TemplateNotFound(template)
+
+        return blob.data_stream.read().decode(self.encoding), template, lambda: True
+
+
 @contextmanager
 def stashed_checkout(repo, branch_name):
+    """
+    A context with everything stashed and `branch_name` checked out in place.
+
+    When the context fails, what it left in the working tree is dropped, so that the previous
+    branch can be checked out and the stash restored.
+    """
     with stashed(repo) as stash:
         with checkout(repo, branch_name) as ref:
-            yield stash, ref
+            try:
+                yield stash, ref
+            except BaseException:
+                # Everything else was stashed with --all
+                repo.git.reset("--hard", "--quiet")
+                repo.git.clean("-f", "-d", "-x", "-q")
+                raise
 
 
 @contextmanager
@@ -68,18 +207,59 @@ def stashed(repo):
 
     stash_created = curr_num_stashed_items - prev_stashed_items > 0
 
-    yield stash_created
-
-    if stash_created:
-        repo.git.stash("pop")
+    try:
+        yield stash_created
+    finally:
+        if stash_created:
+            repo.git.stash("pop")
 
 
 @contextmanager
 def checkout(repo, branch_name):
     """Branch checkout context"""
     prev_head = repo.head.ref
-    yield repo.heads[branch_name].checkout()
-    prev_head.checkout()
+    try:
+        yield repo.heads[branch_name].checkout()
+    finally:
+        prev_head.checkout()
+
+
+def checked_out_branches(repo):
+    """
+    The {name: worktree path} of the branches checked out in a worktree of `repo`.
+
+    Prunable worktrees, whose directory is gone, e.g. after a render was killed, are left out.
+    """
+    branches = {}
+    for block in repo.git.worktree("list", "--porcelain").split("\n\n"):
+        fields = dict(line.partition(" ")[::2] for line in block.splitlines())
+        if "prunable" not in fields and fields.get("branch", "").startswith("refs/heads/"):
+            branches[fields["branch"].split("refs/heads/", 1)[1]] = fields["worktree"]
+    return branches
+
+
+@contextmanager
+def worktree_checkout(repo, branch_name, paths=None):
+    """
+    A context with `branch_name` checked out in a temporary worktree, yields its Repo.
+
+    The worktree's index holds the whole branch, but only `paths` are written to the working
+    tree when they are given, e.g. `()` for none at all.
+    """
+    with TemporaryDirectory(prefix="gittr-worktree-") as tmp_dir:
+        path = os.path.join(tmp_dir, "worktree")
+        repo.git.worktree("add", "--quiet", "--no-checkout", path, branch_name)
+        worktree = Repo(path)
+        try:
+            worktree.git.read_tree("HEAD")
+            if paths is None:
+                worktree.git.checkout_index("--all")
+            elif paths:
+                worktree.git.checkout("HEAD", "--", *paths)
+            yield worktree
+        finally:
+            worktree.close()
+            repo.git.worktree("remove", "--force", path)
 
 
 def resolve_repository_path(repo_path):
@@ -0,0 +1,364 @@
+"""Re-render a local template working copy as it changes.
+
+Only the files that changed, and the templates that include or extend them, are rendered again;
+the Jinja Environment stays warm between updates, so unchanged templates are not recompiled.
+"""
+
+import os
+import re
+import shutil
+import stat
+import subprocess
+import threading
+import time
+from collections import defaultdict
+
+from jinja2 import Environment, meta
+
+from gittr.cli.action import (
+    GHT,
+    GHT_CONF_PATH,
+    create_environment,
+    is_outside_tree,
+    renders_content,
+)
+from gittr.cli.utils import RestrictedFileSystemLoader
+from git import Blob, Head, IndexFile
+from git.index.typ import BaseIndexEntry, IndexEntry
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # pragma: no cover
+    FileSystemEventHandler = object
+    Observer = None
+
+# Seconds between two scans of the template when polling
+POLL_INTERVAL = 0.2
+# Seconds to wait for a burst of changes, e.g. an editor saving several files, to settle
+SETTLE_INTERVAL = 0.05
+REFERENCE_TAG = re.compile(r"{%-?\s*(extends|include|import|from)\b")
+
+
+def template_files(directory):
+    """
+    The files of the template working copy at `directory`, relative to it.
+
+    In a git working copy, the files ignored by git are left out.
+    """
+    try:
+        out = subprocess.run(
+            [
+                "git",
+                "-C",
+                directory,
+                "ls-files",
+                "-z",
+                "--cached",
+                "--others",
+                "--exclude-standard",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        ).stdout
+        return {path for path in out.decode("utf-8").split("\0") if path}
+    except (OSError, subprocess.CalledProcessError):
+        files = set()
+        for root, dirs, names in os.walk(directory):
+            dirs[:] = [d for d in dirs if d != ".git"]
+            rel = os.path.relpath(root, directory)
+            files.update(os.path.normpath(os.path.join(rel, n)).replace(os.sep, "/") for n in names)
+        return files
+
+
+def snapshot(directory):
+    """
+    The {path: (mtime, size, mode)} of each template file at `directory`
+    """
+    rv = {}
+    for path in template_files(directory):
+        try:
+            st = os.lstat(os.path.join(directory, path))
+        except OSError:
+            continue
+        if not stat.S_ISDIR(st.st_mode):
+            rv[path] = (st.st_mtime_ns, st.st_size, st.st_mode)
+    return rv
+
+
+def changed_paths(before, after):
+    """
+    The paths added, removed or modified between two snapshots
+    """
+    return {path for path in before.keys() | after.keys() if before.get(path) != after.get(path)}
+
+
+class _Wakeup(FileSystemEventHandler):
+    def __init__(self, event: threading.Event):
+        super().__init__()
+        self.event = event
+
+    def on_any_event(self, event):
+        if "/.git/" not in event.src_path + "/":
+            self.event.set()
+
+
+def watch_changes(directory, interval=POLL_INTERVAL):
+    """
+    Yield the set of paths changed under `directory`, each time some change.
+
+    With watchdog installed, the changes are waited for with inotify (or the platform's
+    equivalent); otherwise the directory is polled every `interval` seconds. Either way, the
+    changed paths come from comparing snapshots, so bursts of events are coalesced.
+    """
+    wakeup = threading.Event()
+    observer = None
+    if Observer is not None:
+        observer = Observer()
+        observer.schedule(_Wakeup(wakeup), directory, recursive=True)
+        observer.start()
+    try:
+        before = snapshot(directory)
+        while True:
+            if observer is not None:
+                wakeup.wait()
+                time.sleep(SETTLE_INTERVAL)
+                wakeup.clear()
+            else:
+                time.sleep(interval)
+            after = snapshot(directory)
+            paths = changed_paths(before, after)
+            before = after
+            if paths:
+                yield paths
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+
+class DirectoryOutput(object):
+    """
+    Writes the rendered files under `directory`
+    """
+
+    directory: str
+
+    __slots__ = ["directory"]
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    def target(self, path):
+        target = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.lexists(target):
+            os.remove(target)
+        return target
+
+    def write(self, path, source_path, template=None, config=None):
+        """
+        Write the file at `source_path`, or `template` rendered with `config`, to `path`
+        """
+        target = self.target(path)
+        mode = os.lstat(source_path).st_mode
+        if stat.S_ISLNK(mode):
+            os.symlink(os.readlink(source_path), target)
+            return
+        if template is not None:
+            with open(target, "w") as f:
+                template.stream(config).dump(f)
+        else:
+            shutil.copyfile(source_path, target)
+        os.chmod(target, 0o755 if mode & stat.S_IXUSR else 0o644)
+
+    def write_data(self, path, data: bytes):
+        with open(self.target(path), "wb") as f:
+            f.write(data)
+
+    def remove(self, path):
+        target = os.path.join(self.directory, path)
+        if os.path.lexists(target):
+            os.remove(target)
+        parent = os.path.dirname(target)
+        while parent != self.directory and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+    def commit(self, message):
+        pass
+
+
+class BranchOutput(object):
+    """
+    Commits the rendered files onto a ght branch, straight into the object database
+    """
+
+    ght: GHT
+    head: Head
+    index: IndexFile
+
+    __slots__ = ["ght", "head", "index"]
+
+    def __init__(self, ght: GHT, branch):
+        repo = ght.repo
+        if not repo.head.is_detached and repo.active_branch.name == branch:
+            raise ValueError(f"Refusing to render into the checked out branch `{branch}`.")
+        self.ght = ght
+        self.head = repo.heads[branch]
+        self.index = IndexFile.new(repo, self.head.commit.tree)
+        self.index.entries.clear()
+
+    def write(self, path, source_path, template=None, config=None):
+        """
+        Store the file at `source_path`, or `template` rendered with `config`, at `path`
+        """
+        st = os.lstat(source_path)
+        if stat.S_ISLNK(st.st_mode):
+            mode = Blob.link_mode
+            binsha = self.ght.store_blob(os.readlink(source_path).encode("utf-8"))
+        else:
+            mode = Blob.executable_mode if st.st_mode & stat.S_IXUSR else Blob.file_mode
+            if template is not None:
+                binsha = self.ght.store_rendered_blob(template)
+            else:
+                with open(source_path, "rb") as f:
+                    binsha = self.ght.store_blob_stream(f, st.st_size)
+        self.add(path, mode, binsha)
+
+    def write_data(self, path, data: bytes):
+        self.add(path, Blob.file_mode, self.ght.store_blob(data))
+
+    def add(self, path, mode, binsha):
+        self.index.entries[(path, 0)] = IndexEntry.from_base(
+            BaseIndexEntry((mode, binsha, 0, path))
+        )
+
+    def remove(self, path):
+        self.index.entries.pop((path, 0), None)
+
+    def commit(self, message):
+        tree = self.index.write_tree()
+        if tree != self.head.commit.tree:
+            self.ght.commit_objects(tree, self.head, message)
+
+
+class IncrementalRenderer(object):
+    """
+    Renders the template working copy at `template_dir` into `output`, and then re-renders the
+    files that change.
+
+    The configuration comes from .github/ght.yaml in the GHT's `branch`, as for `render_files`.
+    """
+
+    ght: GHT
+    template_dir: str
+    output: object
+    env: Environment
+
+    __slots__ = ["ght", "template_dir", "output", "env", "_ght_yaml", "_outputs", "_references"]
+
+    def __init__(self, ght: GHT, template_dir, output, branch="ght/master"):
+        self.ght = ght
+        self.template_dir = os.path.abspath(template_dir)
+        self.output = output
+        self.env = create_environment(
+            RestrictedFileSystemLoader(self.template_dir), ght.env.bytecode_cache
+        )
+
+        ght_conf: Blob = ght.repo.heads[branch].commit.tree / GHT_CONF_PATH
+        ght_yaml = ght.render_ght_conf_text(ght_conf.data_stream.read().decode("utf-8"))
+        ght.load_config(ght_yaml)
+        self._ght_yaml = ght_yaml
+        # The rendered path of each template path, and the templates each template references
+        self._outputs = {}
+        self._references = {}
+
+    def render_all(self):
+        """
+        Render every file of the template, returns the rendered paths
+        """
+        self.output.write_data(GHT_CONF_PATH, self._ght_yaml.encode("utf-8"))
+        return self.update(template_files(self.template_dir) | set(self._outputs))
+
+    def update(self, paths):
+        """
+        Render the changed template `paths` again, with the templates that reference them, and
+        remove the outputs of the deleted ones. Returns the rendered and removed paths.
+        """
+        paths = self.with_dependents(paths)
+        changed = []
+        for path in sorted(paths):
+            if path == GHT_CONF_PATH:
+                continue
+            source_path = os.path.join(self.template_dir, path)
+            previous = self._outputs.pop(path, None)
+            self._references.pop(path, None)
+            if not os.path.lexists(source_path) or os.path.isdir(source_path):
+                if previous is not None:
+                    self.output.remove(previous)
+                    changed.append(previous)
+                continue
+            rendered = self.render_path(path, source_path)
+            if previous is not None and previous != rendered:
+                self.output.remove(previous)
+                changed.append(previous)
+            changed.append(rendered)
+        self.output.commit(f"[ght]: rendered {self.template_dir} changes")
+        return changed
+
+    def with_dependents(self, paths):
+        """
+        `paths` and the templates that include, import or extend them, transitively
+        """
+        dependents = defaultdict(set)
+        for path, references in self._references.items():
+            for reference in references:
+                dependents[reference].add(path)
+
+        rv, todo = set(), list(paths)
+        while todo:
+            path = todo.pop()
+            if path in rv:
+                continue
+            rv.add(path)
+            todo.extend(dependents.get(path, ()))
+            # Templates with a computed reference, e.g. `{% include name %}`, depend on all
+            todo.extend(dependents.get(None, ()))
+        return rv
+
+    def referenced_templates(self, source_path):
+        """
+        The names of the templates included, imported or extended by the template at
+        `source_path`, with None for the names only known when rendering.
+
+        Only the templates with such a tag are parsed, as most templates have none.
+        """
+        with open(source_path, encoding="utf-8") as f:
+            source = f.read()
+        if not REFERENCE_TAG.search(source):
+            return set()
+        return set(meta.find_referenced_templates(self.env.parse(source)))
+
+    def render_path(self, path, source_path):
+        """
+        Render the template file at `path` into the output, returns its rendered path
+        """
+        ght = self.ght
+        rendered = ght.render_ght_path(path)
+        if is_outside_tree(rendered):
+            raise ValueError(f"Refusing to render {path} outside of the tree: {rendered}")
+
+        template = None
+        if renders_content(path) and stat.S_ISREG(os.lstat(source_path).st_mode):
+            with open(source_path, "rb") as f:
+                needs_rendering = ght.needs_rendering(path, f)
+            if needs_rendering:
+                template = self.env.get_template(path)
+                self._references[path] = self.referenced_templates(source_path)
+                ght.stats["rendered"] += 1
+
+        self.output.write(rendered, source_path, template, ght.config)
+        self._outputs[path] = rendered
+        return rendered
@@ -1,9 +1,18 @@
 import os
+import shutil
+import tarfile
+import tracemalloc
+from io import BytesIO
 
 import pytest
-from git import Repo, Tree, Actor, Blob
+import yaml
+from git import Repo, Tree, Actor, Blob, Commit, IndexFile
 
-from gittr.cli.action import GHT
+from gittr.cli import action
+from gittr.cli.action import GHT, parse_trailers
+from gittr.cli.batch import render_repositories
+from gittr.cli.cache import RenderCache, TemplateMirrors
+from gittr.cli.utils import stashed_checkout
 
 
 @pytest.fixture()
@@ -35,21 +44,23 @@ def template(tmpdir):
 
 
 @pytest.fixture()
-def ght(tmpdir, template: Repo):
-    ght = GHT.init(
-        path=os.path.join(tmpdir, "ght"),
-        config=dict(
-            ght=dict(
-                template=dict(url=f"file://{template.working_tree_dir}", ref="master"),
-                hello="Hello World!",
-                a="alpha",
-                b="beta",
-                c="charlie",
-                abc="{{ght.a}}/{{ght.b}}/{{ght.c}}",
-                abcd="{{ght.abc}}/delta",
-            )
-        ),
+def config(template: Repo):
+    return dict(
+        ght=dict(
+            template=dict(url=f"file://{template.working_tree_dir}", ref="master"),
+            hello="Hello World!",
+            a="alpha",
+            b="beta",
+            c="charlie",
+            abc="{{ght.a}}/{{ght.b}}/{{ght.c}}",
+            abcd="{{ght.abc}}/delta",
+        )
     )
+
+
+@pytest.fixture()
+def ght(tmpdir, config):
+    ght = GHT.init(path=os.path.join(tmpdir, "ght"), config=config)
     assert not ght.repo.bare
 
     ght.fetch_template()
@@ -90,9 +101,23 @@ def test_ght_create_jinja2_environment(ght: GHT):
         assert b.type == "blob"
 
 
-def test_prepare_tree_for_rendering(ght: GHT):
+def test_prepare_tree_for_rendering(ght: GHT, template: Repo):
+    extra = os.path.join(ght.repo.working_tree_dir, "extra", "dir", "file")
+    os.makedirs(os.path.dirname(extra))
+    open(extra, "w").close()
+    ght.repo.index.add([extra])
+    ght.repo.index.commit("An extra file")
+    with open(os.path.join(ght.repo.working_tree_dir, "template.md"), "w") as f:
+        f.write("a local change")
+
     ght.prepare_tree_for_rendering()
     assert "ght/template" not in ght.repo.heads
+    assert not os.path.exists(os.path.join(ght.repo.working_tree_dir, "extra"))
+    assert not ght.repo.is_dirty(index=False)
+
+    blobs = {e.path: e.binsha for e in ght.repo.index.entries.values()}
+    assert blobs.pop(".github/ght.yaml") == (ght.repo.tree() / ".github/ght.yaml").binsha
+    assert blobs == {b.path: b.binsha for b in template.tree().traverse() if b.type == "blob"}
 
 
 def test_render_tree(ght: GHT):
@@ -105,3 +130,566 @@ def test_render_ght_conf(ght: GHT):
     ght.load_config()
     assert ght.config["ght"]["abc"] == "alpha/beta/charlie"
     assert ght.config["ght"]["abcd"] == "alpha/beta/charlie/delta"
+
+
+def test_render_tree_content_jobs(ght: GHT, template: Repo, monkeypatch):
+    for i in range(8):
+        path = os.path.join("{{ght.a}}", f"file_{i}.md.ght")
+        with open(os.path.join(template.working_tree_dir, path), "w") as f:
+            f.write(f"{{{{ ght.hello }}}} {i}")
+        template.index.add([path])
+    template.index.commit("Add templated files")
+
+    ght.prepare_tree_for_rendering()
+    ght.render_tree_content()
+    serial = ght.repo.index.write_tree()
+    assert (serial / "{{ght.a}}/file_7.md.ght").data_stream.read() == b"Hello World! 7"
+
+    pools = []
+
+    class SpyExecutor(action.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            pools.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(action, "ProcessPoolExecutor", SpyExecutor)
+    ght.prepare_tree_for_rendering()
+    ght.jobs = 2
+    ght.render_tree_content()
+    assert len(pools) == 1
+    assert ght.repo.index.write_tree() == serial
+
+
+@pytest.mark.parametrize("num_files", [1, 10, 50])
+def test_render_tree_index_writes(ght: GHT, monkeypatch, num_files):
+    for i in range(num_files):
+        path = os.path.join("{{ght.a}}", f"file_{i}.md.ght")
+        with open(os.path.join(ght.repo.working_tree_dir, path), "w") as f:
+            f.write("{{ ght.hello }}")
+        ght.repo.index.add([path])
+    ght.repo.index.commit("[ght]: add files")
+
+    writes = []
+    index_write = IndexFile.write
+
+    def counting_write(self, *args, **kwargs):
+        writes.append(self)
+        return index_write(self, *args, **kwargs)
+
+    monkeypatch.setattr(IndexFile, "write", counting_write)
+    ght.render_tree_content()
+    ght.render_tree_structure()
+    monkeypatch.undo()
+
+    assert len(writes) == 2
+    ght.repo.index.commit("[ght]: render")
+    for i in range(num_files):
+        b: Blob = ght.repo.tree() / "alpha" / f"file_{i}.md"
+        assert "Hello World!" == b.data_stream.read().decode("utf8")
+
+
+def test_render_tree_objects(tmpdir, config):
+    checkout = GHT.init(path=os.path.join(tmpdir, "checkout"), config=config)
+    with stashed_checkout(checkout.repo, "ght/master"):
+        checkout.render_tree()
+
+    odb = GHT.init(path=os.path.join(tmpdir, "odb"), config=config)
+    odb.render_tree_objects("ght/master")
+
+    assert odb.repo.active_branch.name == "master"
+    assert not odb.repo.is_dirty(untracked_files=True)
+    assert "ght/template" not in odb.repo.heads
+    expected = list(checkout.repo.iter_commits("ght/master"))
+    actual = list(odb.repo.iter_commits("ght/master"))
+    assert len(actual) == len(expected) == 3
+    for e, a in zip(expected, actual):
+        assert a.tree == e.tree
+        assert a.message == e.message
+        assert a.author == e.author and a.committer == e.committer
+
+
+def test_render_tree_content_cache(ght: GHT, tmpdir):
+    ght.cache = RenderCache(os.path.join(tmpdir, "cache"))
+    ght.render_tree_content()
+    expected = ght.repo.index.write_tree()
+    assert ght.cache.hits == 0
+
+    ght.prepare_tree_for_rendering()
+    ght.render_tree_content()
+    assert ght.repo.index.write_tree() == expected
+    assert ght.cache.hits == 1
+    assert not ght.repo.is_dirty(index=False)
+
+
+def test_render_ght_conf_circular(ght: GHT):
+    with pytest.raises(ValueError, match="ght.a -> ght.b -> ght.a"):
+        ght.render_ght_conf_text("ght:\n  a: '{{ght.b}}'\n  b: '{{ght.a}}'")
+
+
+def test_render_ght_path_memoized(ght: GHT, monkeypatch):
+    sources = []
+    from_string = GHT.from_string
+
+    def counting_from_string(self, source):
+        sources.append(source)
+        return from_string(self, source)
+
+    monkeypatch.setattr(GHT, "from_string", counting_from_string)
+    paths = [f"{{{{ght.a}}}}/{{{{ght.b}}}}/plain/file_{i}.ght" for i in range(100)]
+    assert {ght.render_ght_path(path) for path in paths} == {
+        f"alpha/beta/plain/file_{i}" for i in range(100)
+    }
+    assert sorted(sources) == ["{{ght.a}}", "{{ght.b}}"]
+    assert ght.tree_renames() == {
+        "{{ght.a}}": "alpha",
+        "{{ght.a}}/{{ght.b}}": "alpha/beta",
+        "{{ght.a}}/{{ght.b}}/plain": "alpha/beta/plain",
+    }
+
+
+def test_render_tree_content_passthrough(ght: GHT):
+    binary = b"\0{{ ght.hello }}\n"
+    with open(os.path.join(ght.repo.working_tree_dir, "image.png"), "wb") as f:
+        f.write(binary)
+    with open(os.path.join(ght.repo.working_tree_dir, "excluded.md"), "w") as f:
+        f.write("{{ raw }}\n")
+    ght.repo.index.add(["image.png", "excluded.md"])
+    ght.repo.index.commit("[ght]: add pass-through files")
+    ght.config["ght"]["template"]["exclude"] = ["excluded.*"]
+
+    ght.render_tree_content()
+    ght.repo.index.commit("[ght]: render tree content")
+    assert (ght.repo.tree() / "image.png").data_stream.read() == binary
+    assert (ght.repo.tree() / "excluded.md").data_stream.read() == b"{{ raw }}\n"
+    assert (ght.repo.tree() / "template.md").data_stream.read() == b"Hello World!"
+    assert ght.stats == dict(rendered=1, cached=0, copied=5)
+
+
+@pytest.fixture()
+def large_template(template: Repo):
+    # ~2MB of output from a 70 byte template
+    with open(os.path.join(template.working_tree_dir, "large.txt"), "w") as f:
+        f.write("{% for i in range(100000) %}{{ ght.hello }} {{ i }}\n{% endfor %}")
+    template.index.add(["large.txt"])
+    template.index.commit("Add large.txt")
+    return template
+
+
+def traced_peak(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_render_tree_streaming(tmpdir, large_template, config):
+    checkout = GHT.init(path=os.path.join(tmpdir, "checkout"), config=config)
+    with stashed_checkout(checkout.repo, "ght/master"):
+        checkout.prepare_tree_for_rendering()
+        checkout.load_config()
+        assert traced_peak(checkout.render_tree_content) < 1024 * 1024
+        checkout.repo.index.commit("[ght]: render tree content")
+
+    odb = GHT.init(path=os.path.join(tmpdir, "odb"), config=config)
+    assert traced_peak(odb.render_tree_objects, "ght/master") < 1024 * 1024
+
+    expected: Blob = checkout.repo.tree("ght/master") / "large.txt"
+    assert expected.size > 1.5 * 1024 * 1024
+    assert (odb.repo.tree("ght/master") / "large.txt") == expected
+
+
+def synthetic_template(ght: GHT, branch, fanouts):
+    """
+    Commit a template of 100 files per directory, one of them a Jinja2 template, with
+    `fanouts` templated directories per level onto `branch`; identical blobs and subtrees
+    are only stored once
+    """
+    template, plain = ght.store_blob(b"{{ ght.hello }}"), ght.store_blob(b"plain")
+    binsha = ght.store_tree(
+        [(template if i == 0 else plain, 0o100644, f"file_{i}.md") for i in range(100)]
+    )
+    for fanout in fanouts:
+        binsha = ght.store_tree([(binsha, 0o040000, f"{{{{ght.a}}}}_{i}") for i in range(fanout)])
+    author = Actor("GHT Author", "author@example.com")
+    tree = Tree(ght.repo, binsha, 0o040000, "")
+    commit = Commit.create_from_tree(
+        ght.repo, tree, "Synthetic template", head=False, author=author, committer=author
+    )
+    ght.repo.create_head(branch, commit)
+
+
+def test_render_tree_objects_bounded_memory(tmpdir, config):
+    path = os.path.join(tmpdir, "ght")
+    config["ght"]["template"] = dict(url=f"file://{path}")
+    ght = GHT.init(path=path, config=config)
+    synthetic_template(ght, "small", [10])
+    synthetic_template(ght, "large", [10, 10, 10])
+
+    peaks = []
+    for ref in ("small", "large"):
+        ght.template_ref = ref
+        peaks.append(traced_peak(ght.render_tree_objects, "ght/master"))
+    # Grows with the depth and width of the tree, not with its number of files
+    assert peaks[1] < 2 * peaks[0]
+
+    tree = ght.repo.tree("ght/master")
+    assert sum(1 for _ in ght.walk_blobs(tree.binsha)) == 100_001
+    assert (tree / "alpha_9/alpha_0/alpha_5/file_0.md").data_stream.read() == b"Hello World!"
+    assert (tree / "alpha_9/alpha_0/alpha_5/file_99.md").data_stream.read() == b"plain"
+
+
+def test_fetch_template_mirror(ght: GHT, template: Repo, tmpdir):
+    ght.mirrors = TemplateMirrors(os.path.join(tmpdir, "mirrors"), ttl=3600)
+    with ght.fetch_template():
+        first = ght.repo.commit("ght/template")
+    assert os.path.isdir(ght.mirrors.path(ght.template_url))
+
+    template.index.commit("A newer commit")
+    with ght.fetch_template():
+        assert ght.repo.commit("ght/template") == first
+
+    ght.mirrors.ttl = 0
+    with ght.fetch_template():
+        assert ght.repo.commit("ght/template") == template.head.commit
+
+
+@pytest.mark.parametrize("fetch_strategy", ["auto", "config", "shallow", "full"])
+def test_init_fetch_strategy(tmpdir, template: Repo, config, fetch_strategy):
+    os.makedirs(os.path.join(template.working_tree_dir, ".github"))
+    with open(os.path.join(template.working_tree_dir, ".github", "ght.yaml"), "w") as f:
+        yaml.dump(config, f)
+    template.index.add([".github/ght.yaml"])
+    template.index.commit("Add ght.yaml")
+
+    ght = GHT.init(
+        path=os.path.join(tmpdir, "ght"),
+        template_url=config["ght"]["template"]["url"],
+        fetch_strategy=fetch_strategy,
+    )
+    assert ght.config == config
+    assert "ght/template" not in ght.repo.heads
+    is_shallow = os.path.exists(os.path.join(ght.repo.git_dir, "shallow"))
+    assert is_shallow == (fetch_strategy == "shallow")
+
+    with ght.fetch_template():
+        assert len(list(ght.repo.iter_commits("ght/template"))) == (
+            2 if fetch_strategy == "full" else 1
+        )
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_render_repositories(tmpdir, config, jobs):
+    paths = [
+        str(GHT.init(path=os.path.join(tmpdir, name), config=config).repo.working_tree_dir)
+        for name in ("one", "two")
+    ]
+    missing = os.path.join(tmpdir, "missing")
+    mirrors = TemplateMirrors(os.path.join(tmpdir, "mirrors"), ttl=3600)
+    bytecode_dir = os.path.join(tmpdir, "bytecode")
+
+    results = {
+        r.path: r
+        for r in render_repositories(
+            paths + [missing], jobs=jobs, mirrors=mirrors, bytecode_dir=bytecode_dir
+        )
+    }
+    assert [results[p].ok for p in paths + [missing]] == [True, True, False]
+    assert results[missing].error
+    assert all(results[p].stats["rendered"] == 1 for p in paths)
+
+    one, two = (Repo(p) for p in paths)
+    assert one.tree("ght/master") == two.tree("ght/master")
+    assert one.commit("ght/master").message == two.commit("ght/master").message
+    # One mirror for the shared template url, and the compiled templates of a single render
+    assert len([d for d in os.listdir(mirrors.directory) if d.endswith(".git")]) == 1
+    single_dir = os.path.join(tmpdir, "single")
+    three = GHT.init(path=os.path.join(tmpdir, "three"), config=config).repo.working_tree_dir
+    list(render_repositories([three], mirrors=mirrors, bytecode_dir=single_dir))
+    assert sorted(os.listdir(bytecode_dir)) == sorted(os.listdir(single_dir))
+
+
+def test_render_isolation(tmpdir, config):
+    trees = {}
+    for isolation in ("stash", "worktree"):
+        ght = GHT.init(path=os.path.join(tmpdir, isolation), config=config)
+        ght.isolation = isolation
+        ght.load_config()
+        wt = ght.repo.working_tree_dir
+        os.makedirs(os.path.join(wt, "node_modules"))
+        with open(os.path.join(wt, "node_modules", "module.js"), "w") as f:
+            f.write("untracked")
+        with open(os.path.join(wt, ".github", "ght.yaml"), "a") as f:
+            f.write("# a local change\n")
+        untracked_mtime = os.stat(os.path.join(wt, "node_modules", "module.js")).st_mtime_ns
+
+        ght.render()
+        trees[isolation] = ght.repo.tree("ght/master")
+
+        assert ght.repo.working_tree_dir == wt
+        assert ght.repo.head.ref.name == "master"
+        assert ght.repo.git.diff("--stat") != ""
+        assert os.path.exists(os.path.join(wt, "node_modules", "module.js"))
+        assert len(ght.repo.git.worktree("list").splitlines()) == 1
+        if isolation == "worktree":
+            assert os.stat(os.path.join(wt, "node_modules", "module.js")).st_mtime_ns == (
+                untracked_mtime
+            )
+
+    assert trees["stash"] == trees["worktree"]
+    assert (trees["worktree"] / "alpha/beta/charlie").type == "blob"
+
+
+def test_render_stale_worktree(tmpdir, config):
+    ght = GHT.init(path=os.path.join(tmpdir, "ght"), config=config)
+    wt = ght.repo.working_tree_dir
+    os.makedirs(os.path.join(wt, "node_modules"))
+    with open(os.path.join(wt, "node_modules", "module.js"), "w") as f:
+        f.write("untracked")
+
+    # A render killed while it had ght/master checked out in its worktree
+    stale = os.path.join(tmpdir, "stale")
+    ght.repo.git.worktree("add", "--quiet", stale, "ght/master")
+    shutil.rmtree(stale)
+    ght.render()
+    assert ght.repo.commit("ght/master").summary.endswith("structure")
+    assert len(ght.repo.git.worktree("list").splitlines()) == 1
+
+    other = os.path.join(tmpdir, "other")
+    ght.repo.git.worktree("add", "--quiet", other, "ght/master")
+    with pytest.raises(ValueError, match="checked out in another worktree"):
+        ght.render(force=True)
+    assert ght.repo.git.stash("list") == ""
+    assert os.path.exists(os.path.join(wt, "node_modules", "module.js"))
+
+
+def test_stashed_checkout_failure(tmpdir, config):
+    ght = GHT.init(path=os.path.join(tmpdir, "ght"), config=config)
+    wt = ght.repo.working_tree_dir
+    with open(os.path.join(wt, "untracked.txt"), "w") as f:
+        f.write("untracked")
+
+    with pytest.raises(RuntimeError):
+        with stashed_checkout(ght.repo, "ght/master"):
+            with open(os.path.join(wt, ".github", "ght.yaml"), "w") as f:
+                f.write("half rendered")
+            with open(os.path.join(wt, "leftover.txt"), "w") as f:
+                f.write("leftover")
+            raise RuntimeError("render failed")
+
+    assert ght.repo.head.ref.name == "master"
+    assert ght.repo.git.stash("list") == ""
+    assert not ght.repo.is_dirty()
+    assert sorted(os.listdir(wt)) == [".git", ".github", "untracked.txt"]
+
+
+def test_checkout_worktree_paths(ght: GHT):
+    ght.repo.git.branch("ght/other")
+    tree = ght.repo.tree("ght/other")
+    with ght.checkout("ght/other", paths=[".github/ght.yaml"]) as repo:
+        assert ght.repo == repo
+        assert ght.config_path == os.path.join(repo.working_tree_dir, ".github", "ght.yaml")
+        assert sorted(os.listdir(repo.working_tree_dir)) == [".git", ".github"]
+        with open(ght.config_path, "a") as f:
+            f.write("# configured\n")
+        repo.index.add(".github/ght.yaml")
+        repo.index.commit("Configure")
+
+    assert ght.repo.working_tree_dir != repo.working_tree_dir
+    committed = ght.repo.tree("ght/other")
+    assert {b.path for b in committed.traverse()} == {b.path for b in tree.traverse()}
+    assert (committed / ".github/ght.yaml").data_stream.read().endswith(b"# configured\n")
+
+
+def test_load_config_parses_once(ght: GHT, monkeypatch):
+    ght = GHT(ght.repo.working_tree_dir)
+    loads = []
+    yaml_load = yaml.load
+    monkeypatch.setattr(
+        yaml, "load", lambda *args, **kwargs: loads.append(1) or yaml_load(*args, **kwargs)
+    )
+
+    ght.load_config()
+    ght.config["ght"]["hello"] = "changed"
+    ght.load_config()
+    assert len(loads) == 1
+    assert ght.config["ght"]["hello"] == "Hello World!"
+
+    with open(ght.config_path) as f:
+        ght_yaml = f.read()
+    ght.render_ght_conf_text(ght_yaml)
+    ght.render_ght_conf_text(ght_yaml)
+    assert len(loads) == 1
+    assert ght.config["ght"]["abcd"] == "{{ght.abc}}/delta"
+
+
+def test_render_tar(tmpdir, template: Repo, config):
+    odb = GHT.init(path=os.path.join(tmpdir, "odb"), config=config)
+    odb.render_tree_objects("ght/master")
+
+    ght = GHT.init(path=os.path.join(tmpdir, "tar"), config=config)
+    refs = {ref.path: ref.commit for ref in ght.repo.refs}
+    index = ght.repo.index.write_tree()
+
+    output = BytesIO()
+    ght.render_tar(output)
+    output.seek(0)
+    with tarfile.open(fileobj=output) as tar:
+        members = tar.getmembers()
+        rendered = {m.name: tar.extractfile(m).read() for m in members}
+
+    assert [m.name for m in members] == sorted(rendered)
+    assert {m.mtime for m in members} == {template.head.commit.committed_date}
+    again = BytesIO()
+    ght.render_tar(again)
+    assert again.getvalue() == output.getvalue()
+    expected = odb.repo.tree("ght/master")
+    assert rendered == {
+        b.path: b.data_stream.read() for b in expected.traverse() if b.type == "blob"
+    }
+    assert {ref.path: ref.commit for ref in ght.repo.refs} == refs
+    assert ght.repo.index.write_tree() == index
+    assert not ght.repo.is_dirty(untracked_files=True)
+
+
+def test_render_files_outside_tree(tmpdir, config):
+    config["ght"]["a"] = ".."
+    ght = GHT.init(path=os.path.join(tmpdir, "ght"), config=config)
+    with pytest.raises(ValueError, match="outside of the tree"):
+        ght.render_dir(os.path.join(tmpdir, "output"))
+    assert not os.path.exists(os.path.join(tmpdir, "beta"))
+
+
+@pytest.mark.parametrize(
+    "values, error",
+    [
+        (dict(a=".."), "outside of the tree: ../beta/carlos"),
+        (dict(a="/tmp"), "outside of the tree: /tmp/beta/carlos"),
+        (dict(c="carlos"), "to the same path: alpha/beta/carlos"),
+    ],
+)
+def test_render_tree_structure_refused(tmpdir, config, values, error):
+    config["ght"].update(values)
+    ght = GHT.init(path=os.path.join(tmpdir, "ght"), config=config)
+    head = ght.repo.commit("ght/master")
+    with pytest.raises(ValueError, match=error):
+        ght.render()
+    assert ght.repo.commit("ght/master~1") == head
+    assert not os.path.exists(os.path.join(tmpdir, "beta"))
+    assert len(ght.repo.git.worktree("list").splitlines()) == 1
+
+
+@pytest.mark.parametrize("backend", ["checkout", "odb"])
+def test_render_template_layers(tmpdir, template: Repo, config, backend):
+    overlay = Repo.init(os.path.join(tmpdir, "overlay"))
+    for path, content in [("template.md", "{{ ght.hello }} again"), ("{{ght.a}}", "a file")]:
+        with open(os.path.join(overlay.working_tree_dir, path), "w") as f:
+            f.write(content)
+    overlay.index.add(["template.md", "{{ght.a}}"])
+    author = Actor("GHT Author", "author@example.com")
+    overlay.index.commit("Overlay", author=author, committer=author)
+
+    urls = [config["ght"].pop("template")["url"], f"file://{overlay.working_tree_dir}"]
+    config["ght"]["templates"] = [dict(url=urls[0]), dict(url=urls[1], ref="master")]
+    ght = GHT.init(path=os.path.join(tmpdir, "ght"), config=config)
+    ght.render(backend=backend)
+
+    tree = ght.repo.tree("ght/master")
+    assert sorted(b.path for b in tree.traverse() if b.type == "blob") == [
+        ".github/ght.yaml",
+        "alpha",
+        "template.md",
+        "unchanged.md",
+    ]
+    assert (tree / "template.md").data_stream.read() == b"Hello World! again"
+    assert (tree / "alpha").data_stream.read() == b"a file"
+    commit = ght.repo.commit("ght/master")
+    assert commit.summary == f"[ght]: rendered {', '.join(urls)} structure"
+    assert parse_trailers(commit.message)[:4] == [
+        ("Ght-Template-Url", urls[0]),
+        ("Ght-Template-Commit", template.head.commit.hexsha),
+        ("Ght-Template-Url", urls[1]),
+        ("Ght-Template-Commit", overlay.head.commit.hexsha),
+    ]
+    assert [h.name for h in ght.repo.heads] == ["ght/master", "master"]
+
+
+def test_merge(tmpdir, config):
+    ght = GHT.init(path=os.path.join(tmpdir, "ght"), config=config)
+    ght.render()
+    wt = ght.repo.working_tree_dir
+    with open(os.path.join(wt, "local.txt"), "w") as f:
+        f.write("untracked")
+
+    merge = ght.merge("ght/master", "master")
+    assert merge.summary == "Merge branch 'ght/master'"
+    assert [p.hexsha for p in merge.parents] == [
+        ght.repo.commit("master~1").hexsha,
+        ght.repo.commit("ght/master").hexsha,
+    ]
+    assert ght.repo.head.commit == merge
+    with open(os.path.join(wt, "template.md")) as f:
+        assert f.read() == "Hello World!"
+    assert not ght.repo.is_dirty()
+    assert ght.merge("ght/master", "master") is None
+
+    with open(os.path.join(wt, "template.md"), "w") as f:
+        f.write("Hello from master")
+    ght.repo.index.add(["template.md"])
+    ght.repo.index.commit("Change template.md")
+    master = ght.repo.commit("master")
+    config["ght"]["hello"] = "Hello again"
+    ght.repo.git.checkout("ght/master")
+    with open(ght.config_path, "w") as f:
+        yaml.dump(config, f)
+    ght.repo.index.add([".github/ght.yaml"])
+    ght.repo.index.commit("Change hello")
+    ght.repo.git.checkout("master")
+    ght.load_config()
+    ght.render()
+
+    with pytest.raises(ValueError, match="conflicts in:\n  template.md\n"):
+        ght.merge("ght/master", "master")
+    assert ght.repo.commit("master") == master
+    assert not ght.repo.is_dirty()
+
+
+@pytest.mark.parametrize("backend", ["checkout", "odb"])
+def test_render_up_to_date(tmpdir, template: Repo, config, backend):
+    ght = GHT.init(path=os.path.join(tmpdir, "ght"), config=config)
+    assert ght.render(backend=backend)
+    head = ght.repo.commit("ght/master")
+    assert dict(parse_trailers(head.message))["Ght-Template-Commit"] == template.head.commit.hexsha
+
+    assert not ght.render(backend=backend)
+    assert ght.repo.commit("ght/master") == head
+    assert ght.render(backend=backend, force=True)
+    assert ght.repo.commit("ght/master~2") == head
+
+    template.index.commit("A newer commit")
+    ght.mirrors = TemplateMirrors(os.path.join(tmpdir, "mirrors"), ttl=3600)
+    assert ght.render(backend=backend)
+    head = ght.repo.commit("ght/master")
+    assert not ght.render(backend=backend)
+    assert ght.mirrors.stats()["misses"] == 1
+
+    config["ght"]["hello"] = "Hello again"
+    ght.repo.git.checkout("ght/master")
+    with open(ght.config_path, "w") as f:
+        yaml.dump(config, f)
+    ght.repo.index.add([".github/ght.yaml"])
+    ght.repo.index.commit("Change hello")
+    ght.repo.git.checkout("master")
+    assert ght.render(backend=backend)
+    assert (ght.repo.tree("ght/master") / "template.md").data_stream.read() == b"Hello again"
+    assert not ght.render(backend=backend)
+
+
+def test_parse_trailers():
+    assert parse_trailers("Subject\n\nBody\n\nKey: value\nOther-Key: a: b\n") == [
+        ("Key", "value"),
+        ("Other-Key", "a: b"),
+    ]
+    assert parse_trailers("[ght]: rendered structure") == []
+    assert parse_trailers("Subject\n\nNot a trailer\nKey: value") == []
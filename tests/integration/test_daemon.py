@@ -0,0 +1,89 @@
+import os
+import threading
+
+import pytest
+from click.testing import CliRunner
+from git import Actor, Repo
+
+from gittr.cli.action import GHT
+from gittr.cli.cli import cli
+from gittr.cli.client import send_request
+from gittr.cli.daemon import RenderServer
+
+
+@pytest.fixture()
+def config(tmpdir):
+    repo = Repo.init(os.path.join(tmpdir, "template"))
+    os.makedirs(os.path.join(repo.working_tree_dir, "{{ght.a}}"))
+    with open(os.path.join(repo.working_tree_dir, "{{ght.a}}", "template.md"), "w") as f:
+        f.write("{{ ght.hello }}")
+    repo.index.add(["{{ght.a}}/template.md"])
+    author = Actor("GHT Author", "author@example.com")
+    repo.index.commit("Initial commit", author=author, committer=author)
+    return dict(
+        ght=dict(
+            template=dict(url=f"file://{repo.working_tree_dir}", ref="master"),
+            hello="Hello World!",
+            a="alpha",
+        )
+    )
+
+
+@pytest.fixture()
+def server(tmpdir):
+    server = RenderServer(
+        os.path.join(tmpdir, "gittr.sock"), os.path.join(tmpdir, "mirrors"), max_requests=2
+    )
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_daemon_render(tmpdir, config, server: RenderServer):
+    socket_path = server.server_address
+    paths = [
+        GHT.init(path=os.path.join(tmpdir, name), config=config).repo.working_tree_dir
+        for name in ("one", "two")
+    ]
+    for path in paths:
+        response = send_request(socket_path, dict(command="render", repo_path=path))
+        assert response["ok"], response["error"]
+        assert response["stats"]["rendered"] == 1
+        tree = Repo(path).tree("ght/master")
+        assert (tree / "alpha/template.md").data_stream.read() == b"Hello World!"
+
+    response = send_request(socket_path, dict(command="render", repo_path=str(tmpdir)))
+    assert not response["ok"]
+    assert "Not a gittr repository" in response["error"]
+
+    stats = send_request(socket_path, dict(command="stats"))["stats"]
+    assert stats["requests"] == dict(running=0, waiting=0, rendered=2, failed=1)
+    caches = stats["caches"]
+    assert caches["mirrors"]["misses"] == 1 and caches["mirrors"]["hits"] >= 1
+    assert caches["configs"]["hit_rate"] > 0.5
+    assert caches["bytecode"]["hits"] == caches["bytecode"]["misses"]
+
+
+def test_daemon_cli(tmpdir, config, server: RenderServer, monkeypatch):
+    ght = GHT.init(path=os.path.join(tmpdir, "ght"), config=config)
+    monkeypatch.chdir(ght.repo.working_tree_dir)
+    runner = CliRunner()
+
+    result = runner.invoke(cli, ["render", "--daemon", "--socket", server.server_address])
+    assert result.exit_code == 0, result.output
+    assert "Rendered 1 files" in result.output
+    assert ght.repo.commit("ght/master").summary.endswith("structure")
+
+    result = runner.invoke(cli, ["render", "--daemon", "--socket", server.server_address])
+    assert result.exit_code == 0, result.output
+    assert "ght/master is up to date" in result.output
+
+    result = runner.invoke(cli, ["render", "--daemon", "--socket", str(tmpdir / "missing.sock")])
+    assert result.exit_code != 0
+    assert "Start it with `gittr serve`" in result.output
+
+    result = runner.invoke(cli, ["serve", "--stop", "--socket", server.server_address])
+    assert result.exit_code == 0, result.output
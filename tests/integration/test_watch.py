@@ -0,0 +1,80 @@
+import os
+
+import pytest
+from git import Repo
+
+from gittr.cli.action import GHT
+from gittr.cli.watch import (
+    BranchOutput,
+    DirectoryOutput,
+    IncrementalRenderer,
+    changed_paths,
+    snapshot,
+)
+
+
+def write(directory, path, content):
+    path = os.path.join(directory, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+@pytest.fixture()
+def template_dir(tmpdir):
+    path = os.path.join(tmpdir, "template")
+    Repo.init(path)
+    write(path, "base.j2", "base")
+    write(path, "page.md", "{% include 'base.j2' %} {{ ght.hello }}")
+    write(path, "{{ght.a}}/plain.txt", "plain")
+    write(path, "ignored.swp", "swap")
+    write(path, ".gitignore", "*.swp\n")
+    return path
+
+
+@pytest.fixture()
+def ght(tmpdir):
+    config = dict(ght=dict(hello="Hello World!", a="alpha"))
+    return GHT.init(path=os.path.join(tmpdir, "ght"), config=config)
+
+
+def test_watch_directory(tmpdir, template_dir, ght: GHT):
+    output_dir = os.path.join(tmpdir, "output")
+    renderer = IncrementalRenderer(ght, template_dir, DirectoryOutput(output_dir))
+    assert sorted(renderer.render_all()) == [".gitignore", "alpha/plain.txt", "base.j2", "page.md"]
+    with open(os.path.join(output_dir, "page.md")) as f:
+        assert f.read() == "base Hello World!"
+    assert os.path.exists(os.path.join(output_dir, ".github", "ght.yaml"))
+
+    before = snapshot(template_dir)
+    write(template_dir, "base.j2", "changed base")
+    assert changed_paths(before, snapshot(template_dir)) == {"base.j2"}
+    assert sorted(renderer.update({"base.j2"})) == ["base.j2", "page.md"]
+    with open(os.path.join(output_dir, "page.md")) as f:
+        assert f.read() == "changed base Hello World!"
+
+    os.remove(os.path.join(template_dir, "{{ght.a}}", "plain.txt"))
+    assert renderer.update({"{{ght.a}}/plain.txt"}) == ["alpha/plain.txt"]
+    assert not os.path.exists(os.path.join(output_dir, "alpha"))
+
+
+def test_watch_branch(template_dir, ght: GHT):
+    renderer = IncrementalRenderer(ght, template_dir, BranchOutput(ght, "ght/master"))
+    renderer.render_all()
+    tree = ght.repo.tree("ght/master")
+    assert sorted(b.path for b in tree.traverse() if b.type == "blob") == [
+        ".github/ght.yaml",
+        ".gitignore",
+        "alpha/plain.txt",
+        "base.j2",
+        "page.md",
+    ]
+
+    write(template_dir, "page.md", "{{ ght.hello }} again")
+    assert renderer.update({"page.md"}) == ["page.md"]
+    commit = ght.repo.commit("ght/master")
+    assert (commit.tree / "page.md").data_stream.read() == b"Hello World! again"
+    assert commit.parents[0].tree == tree
+
+    renderer.update({"page.md"})
+    assert ght.repo.commit("ght/master") == commit
@@ -0,0 +1,57 @@
+from jinja2 import Environment
+
+from gittr.cli.cache import BytecodeCache, RenderCache, config_hash, is_cacheable
+
+
+def test_render_cache_lru(tmpdir):
+    cache = RenderCache(str(tmpdir), max_entries=2)
+    keys = [RenderCache.key(bytes([i]) * 20, config_hash({})) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, bytes([i]) * 20)
+    assert cache.get(keys[0]) == bytes([0]) * 20
+    cache.close()
+
+    cache = RenderCache(str(tmpdir), max_entries=2)
+    assert len(cache) == 2
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) == bytes([2]) * 20
+    assert cache.get(keys[0], valid=lambda binsha: False) is None
+    assert cache.stats() == dict(hits=1, misses=2, entries=2)
+    cache.close()
+
+
+def test_render_cache_key():
+    digest = config_hash(dict(ght=dict(a="alpha")))
+    assert RenderCache.key(b"\0" * 20, digest) == RenderCache.key(b"\0" * 20, digest)
+    assert RenderCache.key(b"\0" * 20, digest) != RenderCache.key(b"\1" * 20, digest)
+    assert digest != config_hash(dict(ght=dict(a="beta")))
+
+
+def test_is_cacheable():
+    assert is_cacheable(b"{{ ght.hello }}")
+    assert not is_cacheable(b"{% include 'other.md' %}")
+    assert not is_cacheable(b"{%- now 'utc', '%Y' %}")
+
+
+def test_bytecode_cache_from_string(tmpdir, monkeypatch):
+    bcc = BytecodeCache(str(tmpdir))
+    env = Environment(bytecode_cache=bcc)
+    assert bcc.from_string(env, "{{ ght.a }}").render(ght=dict(a="alpha")) == "alpha"
+
+    def compile_fail(*args, **kwargs):
+        raise AssertionError("template was compiled twice")
+
+    monkeypatch.setattr(env, "compile", compile_fail)
+    assert bcc.from_string(env, "{{ ght.a }}").render(ght=dict(a="beta")) == "beta"
+
+
+def test_bytecode_cache_prune(tmpdir):
+    bcc = BytecodeCache(str(tmpdir))
+    env = Environment(bytecode_cache=bcc)
+    for i in range(10):
+        bcc.from_string(env, f"{{{{ ght.a }}}} {i}")
+    assert len(tmpdir.listdir()) == 10
+
+    bcc.max_bytes = 0
+    bcc.prune()
+    assert len(tmpdir.listdir()) == 0
@@ -2,6 +2,10 @@
 
 """Tests for `ght` package."""
 
+import os
+import subprocess
+import sys
+
 import pytest
 from click.testing import CliRunner
 from gittr.cli import cli
@@ -31,4 +35,59 @@ def test_command_line_interface():
     assert "Usage: cli" in result.output
     help_result = runner.invoke(cli.cli, ["--help"])
     assert help_result.exit_code == 0
-    assert "--help  Show this message and exit." in help_result.output
+    assert "--help        Show this message and exit." in help_result.output
+
+
+def test_help_imports():
+    """`gittr --help` does not import the libraries that only the subcommands need"""
+    script = (
+        "import sys\n"
+        "from gittr.cli import cli\n"
+        "try:\n"
+        "    cli.cli(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(' '.join(sys.modules), file=sys.stderr)\n"
+    )
+    out = subprocess.run([sys.executable, "-c", script], capture_output=True, check=True)
+    modules = set(out.stderr.decode().split())
+    assert b"Usage:" in out.stdout
+    assert not modules.intersection({"git", "jinja2", "yaml", "gittr.cli.action"})
+
+
+def test_lazy_plugins(tmpdir, monkeypatch):
+    with open(os.path.join(tmpdir, "gittr_hello.py"), "w") as f:
+        f.write(
+            "import click\n"
+            "@click.command()\n"
+            "def hello():\n"
+            "    '''Say hello'''\n"
+            "    click.echo('hello from a plugin')\n"
+        )
+    monkeypatch.syspath_prepend(str(tmpdir))
+    monkeypatch.setattr(cli.cli, "_plugins", {"hello": "gittr_hello:hello"})
+    monkeypatch.delitem(cli.cli.commands, "hello", raising=False)
+
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, ["--help"])
+    assert "hello        Plugin from gittr_hello:hello." in result.output
+    assert "gittr_hello" not in sys.modules
+
+    result = runner.invoke(cli.cli, ["hello"])
+    assert result.output == "hello from a plugin\n"
+    assert "gittr_hello" in sys.modules
+    monkeypatch.delitem(sys.modules, "gittr_hello")
+    monkeypatch.delitem(cli.cli.commands, "hello")
+
+
+def test_entry_points_cache(tmpdir, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir))
+    assert cli.entry_points("gittr") == {}
+    assert os.path.exists(cli.plugin_cache_path())
+
+    # The second discovery is answered from the cache, without the entrypoints library
+    monkeypatch.setitem(sys.modules, "entrypoints", None)
+    assert cli.entry_points("gittr") == {}
+    monkeypatch.syspath_prepend(str(tmpdir))
+    with pytest.raises(ImportError):
+        cli.entry_points("gittr")
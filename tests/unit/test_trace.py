@@ -0,0 +1,46 @@
+import json
+import os
+
+from git import Git
+
+from gittr.cli import trace
+
+
+def test_git_subcommand():
+    assert trace.git_subcommand(["git", "fetch", "origin"]) == "fetch"
+    assert trace.git_subcommand(["git", "-c", "a=b", "-C", "dir", "--no-pager", "log"]) == "log"
+    assert trace.git_subcommand(["git"]) == ""
+
+
+def test_disabled():
+    assert trace._tracer is None
+    with trace.span("noop"):
+        trace.counter("noop", value=1)
+    assert Git.execute is trace._git_execute
+
+
+def test_trace(tmpdir):
+    path = os.path.join(tmpdir, "trace.json")
+
+    @trace.traced
+    def phase():
+        Git().version()
+
+    trace.start(path, name="gittr test")
+    with trace.span("outer", key="value"):
+        phase()
+    trace.counter("files", rendered=2)
+    trace.stop()
+    assert trace._tracer is None
+    assert Git.execute is trace._git_execute
+
+    with open(path) as f:
+        data = json.load(f)
+    spans = {e["name"]: e for e in data["traceEvents"] if e["ph"] == "X"}
+    assert set(spans) == {"gittr test", "outer", "test_trace.<locals>.phase", "git version"}
+    assert spans["outer"]["args"] == dict(key="value")
+    assert spans["git version"]["args"]["argv"] == ["git", "version"]
+    for inner, outer in [("git version", "test_trace.<locals>.phase"), ("outer", "gittr test")]:
+        assert spans[outer]["ts"] <= spans[inner]["ts"]
+        assert spans[inner]["ts"] + spans[inner]["dur"] <= spans[outer]["ts"] + spans[outer]["dur"]
+    assert data["otherData"]["counters"] == dict(files=dict(rendered=2))
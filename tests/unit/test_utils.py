@@ -1,12 +1,44 @@
-from gittr.cli.utils import iterable_converged
+from io import BytesIO
 
+import pytest
+from jinja2 import Environment
 
-def test_iterable_converged():
-    foo = "foo"
-    bar = "bar"
-    foobar = "foobar"
+from gittr.cli.utils import (
+    is_template,
+    referenced_paths,
+    templated_values,
+    toposort,
+)
 
-    assert iterable_converged(foo, foo)[0]
-    assert not iterable_converged(foo, bar)[0]
-    assert not iterable_converged(foo, foobar)[0]
-    assert not iterable_converged(foobar, foo)[0]
+
+def test_toposort():
+    order = toposort({"c": {"b"}, "b": {"a"}, "a": set(), "d": set()})
+    assert order.index("a") < order.index("b") < order.index("c")
+    assert set(order) == {"a", "b", "c", "d"}
+
+    with pytest.raises(ValueError, match="a -> b -> a"):
+        toposort({"a": {"b"}, "b": {"a"}})
+
+
+def test_referenced_paths():
+    env = Environment()
+    ast = env.parse(
+        "{{ ght.a }}/{{ ght['b'].c | upper }}{% for x in ght.items %}{{ x }}{% endfor %}"
+    )
+    assert set(referenced_paths(ast)) == {("ght", "a"), ("ght", "b", "c"), ("ght", "items"), ("x",)}
+
+
+def test_templated_values():
+    config = dict(ght=dict(a="alpha", abc="{{ght.a}}", items=["{{ght.a}}", 1]))
+    assert dict(templated_values(config)) == {
+        ("ght", "abc"): "{{ght.a}}",
+        ("ght", "items", 0): "{{ght.a}}",
+    }
+
+
+def test_is_template():
+    assert is_template(BytesIO(b"{{ ght.hello }}"))
+    assert is_template(BytesIO(b"x" * 100 + b"{"), chunk_size=1) is False
+    assert is_template(BytesIO(b"x" * 9000 + b"{%"), chunk_size=7)
+    assert not is_template(BytesIO(b"plain text\n"))
+    assert not is_template(BytesIO(b"\0{{ ght.hello }}"))